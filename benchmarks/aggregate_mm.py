@@ -0,0 +1,86 @@
+"""
+Бенчмарк выбора минимальной цены конкурента по seller_id.
+
+Запуск:
+    python -m benchmarks.aggregate_mm [-n 100000 1000000]
+
+Сравнивает MinPriceAggregator с исходной реализацией на concat + groupby.apply
+и проверяет, что результаты совпадают.
+"""
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from scr.parser_mm import MinPriceAggregator, my_markets
+
+SELLERS = my_markets + [f"Магазин {i}" for i in range(200)]
+
+
+def generate_pages(offers_count, offers_per_page=20, seed=0):
+    """Список страниц (seller_id, name, [(продавец, текст цены), ...])"""
+    rng = np.random.default_rng(seed)
+    pages = []
+    for page in range(offers_count // offers_per_page):
+        sellers = rng.choice(SELLERS, offers_per_page)
+        prices = rng.integers(1000, 100000, offers_per_page)
+        offers = [(str(seller), f"{price // 1000} {price % 1000:03d} ₽") for seller, price in zip(sellers, prices)]
+        pages.append((str(page % (offers_count // offers_per_page // 2 or 1)), f"Товар {page}", offers))
+    return pages
+
+
+def legacy_aggregate(pages):
+    """Исходная реализация scrape_megamarket: DataFrame на страницу, concat и groupby.apply"""
+    result_data = []
+    for seller_id, name, offers in pages:
+        df = pd.DataFrame(offers, columns=['market_with_mp', 'mp_on_market'])
+        df['mp_on_market'] = df['mp_on_market'].apply(lambda x: float(''.join(c for c in x if c.isdigit() or c == '.')))
+        df['name'] = name
+        df['seller_id'] = seller_id
+        result_data.append(df)
+    result_df = pd.concat(result_data, ignore_index=True)
+    result_df = result_df[~result_df['market_with_mp'].isin(my_markets)]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        min_price_df = result_df.groupby('seller_id').apply(
+            lambda x: x.loc[x['mp_on_market'].idxmin()]
+        ).reset_index(drop=True)
+    return min_price_df[['seller_id', 'name', 'mp_on_market', 'market_with_mp']]
+
+
+def columnar_aggregate(pages):
+    aggregator = MinPriceAggregator(exclude=my_markets)
+    for seller_id, name, offers in pages:
+        aggregator.add(seller_id, name, offers)
+    return aggregator.result()
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк агрегации предложений")
+    parser.add_argument("-n", "--offers", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--skip-legacy-above", type=int, default=200_000,
+                        help="Не запускать исходную реализацию на больших объёмах")
+    args = parser.parse_args()
+
+    for count in args.offers:
+        pages = generate_pages(count)
+        result, seconds = timed(columnar_aggregate, pages)
+        line = f"{count:>9} предложений: колоночная {seconds:7.3f} с"
+        if count <= args.skip_legacy_above:
+            expected, legacy_seconds = timed(legacy_aggregate, pages)
+            identical = expected.reset_index(drop=True).equals(result)
+            line += f", исходная {legacy_seconds:7.3f} с, x{legacy_seconds / seconds:5.1f}, " \
+                    f"{'совпадает' if identical else 'ОТЛИЧАЕТСЯ'}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Микро-бенчмарк разбора предложений со страниц товаров ММ.
+
+Запуск:
+    python -m benchmarks.extract_mm [страницы .html/.html.gz или каталоги ...]
+
+Без аргументов страница генерируется. Для каждого парсера проверяется,
+что результат совпадает с исходной реализацией extract_data.
+Если какой-то парсер не установлен, бенчмарк завершается с ошибкой.
+"""
+import argparse
+import gzip
+import os
+import random
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from scr.extract_mm import EXTRACTORS, _AVAILABLE
+from scr.logger import logger
+from scr.parser_mm import extract_data
+
+
+def legacy_extract_data(html_content):
+    """Исходная реализация extract_data для сверки результатов"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    data = []
+    for offer in soup.find_all('div', class_='product-offer'):
+        seller_name = offer.find('span', class_='pdp-merchant-rating-block__merchant-name')
+        current_price = offer.find('span', class_='product-offer-price__amount')
+        data.append({
+            'market_with_mp': seller_name.text if seller_name else "N/A",
+            'mp_on_market': current_price.text.strip() if current_price else "N/A"
+        })
+    if not data:
+        return None
+    df = pd.DataFrame(data)
+    df['mp_on_market'] = df['mp_on_market'].apply(
+        lambda x: float(re.sub(r'[^\d.]', '', x)) if x != "N/A" else np.nan)
+    return df
+
+
+def synthetic_page(offers=40, filler_kb=2000):
+    filler = ''.join(f'<div class="card"><a href="/p/{i}">Товар {i}</a><span>{i} ₽</span></div>'
+                     for i in range(filler_kb * 1024 // 140))
+    offer_html = ''.join(
+        '<div class="product-offer product-offer_active"><div class="pdp-merchant-rating-block">'
+        f'<span class="pdp-merchant-rating-block__merchant-name">Магазин {i}</span></div>'
+        f'<span class="product-offer-price__amount"> {random.randint(1, 99)} {random.randint(100, 999)} ₽ </span>'
+        '</div>'
+        for i in range(offers))
+    return f'<html><head><title>Товар</title></head><body>{filler}<div class="offers">{offer_html}</div>{filler}</body></html>'
+
+
+def load_pages(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(root, name) for root, _, names in os.walk(path)
+                      for name in names if name.endswith(('.html', '.html.gz'))]
+        else:
+            files.append(path)
+    pages = []
+    for file in sorted(files):
+        opener = gzip.open if file.endswith('.gz') else open
+        with opener(file, 'rt', encoding='utf-8') as f:
+            pages.append(f.read())
+    return pages
+
+
+def bench(func, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for page in pages:
+            func(page)
+        best = min(best, time.perf_counter() - started)
+    return best / len(pages) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора предложений")
+    parser.add_argument("paths", nargs="*", help="Сохранённые страницы или каталоги с ними")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Количество повторов")
+    args = parser.parse_args()
+
+    pages = load_pages(args.paths) if args.paths else [synthetic_page()]
+    if not pages:
+        sys.exit("Страницы не найдены")
+    print(f"Страниц: {len(pages)}, средний размер: {sum(map(len, pages)) / len(pages) / 1024:.0f} КБ")
+
+    reference = [legacy_extract_data(page) for page in pages]
+    legacy_ms = bench(legacy_extract_data, pages, args.repeat)
+    print(f"{'legacy bs4':<24} {legacy_ms:9.2f} мс/стр")
+
+    missing = []
+    for backend in EXTRACTORS:
+        if not _AVAILABLE[backend]:
+            print(f"{backend:<24} НЕ УСТАНОВЛЕН")
+            missing.append(backend)
+            continue
+        for offers_only in (False, True):
+            func = lambda page: extract_data(page, logger, backend, offers_only)
+            identical = all(
+                (expected is None and result is None) or
+                (expected is not None and result is not None and expected.equals(result))
+                for expected, result in zip(reference, map(func, pages)))
+            ms = bench(func, pages, args.repeat)
+            name = f"{backend}{' offers-only' if offers_only else ''}"
+            print(f"{name:<24} {ms:9.2f} мс/стр  x{legacy_ms / ms:5.1f}  "
+                  f"{'совпадает' if identical else 'ОТЛИЧАЕТСЯ'}")
+
+    if missing:
+        sys.exit(f"Парсеры не установлены: {', '.join(missing)} (pip install -r requirements.txt)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Бенчмарк памяти и времени обработки диапазона: чтение ответа batchGet, update_dataframe
+и compare_prices_and_create_for_update.
+
+Запуск:
+    python -m benchmarks.frame_schema_mm [-n 10000 100000 1000000]
+
+Все пути начинаются со значений ответа batchGet (списки строк таблицы):
+- исходный: таблица из объектов, merge с копиями обеих таблиц и круговым преобразованием типа seller_id;
+- приведение: таблица из объектов, затем apply_schema и обновление с выравниванием по seller_id;
+- схема: колонки сразу создаются по схеме (build_typed_frame со schema), то же обновление.
+Пик памяти измеряется tracemalloc отдельно для чтения и для всей обработки,
+размер итоговой таблицы - memory_usage(deep=True).
+"""
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from scr.data_fetcher import build_typed_frame
+from scr.schema_mm import MM_SCHEMA, apply_schema, frame_mb
+from scr.update_data_mm import compare_prices_and_create_for_update, update_dataframe
+
+
+def legacy_update(df1, df2):
+    """Исходная реализация update_dataframe"""
+    df1_updated = df1.copy()
+    df2_updated = df2.copy()
+    df1_updated['seller_id'] = df1_updated['seller_id'].astype(str)
+    df2_updated['seller_id'] = df2_updated['seller_id'].astype(str)
+    merged_df = df1_updated.merge(df2_updated[['seller_id', 'mp_on_market', 'market_with_mp']],
+                                  on='seller_id', how='left', suffixes=('', '_new'))
+    merged_df['mp_on_market'] = merged_df['mp_on_market_new'].fillna(merged_df['mp_on_market'])
+    merged_df['market_with_mp'] = merged_df['market_with_mp_new'].fillna(merged_df['market_with_mp'])
+    merged_df = merged_df.drop(['mp_on_market_new', 'market_with_mp_new'], axis=1)
+    merged_df['seller_id'] = merged_df['seller_id'].astype(df1['seller_id'].dtype)
+    return merged_df
+
+
+COLUMNS = list(MM_SCHEMA)
+NUMERIC_COLUMNS = [col for col, kind in MM_SCHEMA.items() if kind == 'price']
+
+
+def generate_data(rows, seed=0):
+    """Значения диапазона в виде ответа batchGet и результат загрузки цен конкурентов"""
+    rng = np.random.default_rng(seed)
+    mp_on_market = rng.integers(500, 50000, rows).astype(float)
+    markets = [f"Магазин {i}" for i in range(300)]
+    names = [f"Товар {i}" for i in range(max(rows // 5, 1))]
+    name_rows = rng.integers(0, len(names), rows)
+    market_rows = rng.integers(0, len(markets), rows)
+    prices = mp_on_market + rng.integers(-300, 1000, rows)
+    stops = mp_on_market - rng.integers(-100, 400, rows)
+    # Артикулы и цены приходят числами, пустые ячейки в конце строки обрезаются
+    values = [[i, names[name_rows[i]], f"https://megamarket.ru/catalog/details/{i}", int(prices[i]), int(stops[i]),
+               int(mp_on_market[i]), markets[market_rows[i]]] for i in range(rows)]
+    scraped_rows = rng.choice(rows, rows * 2 // 3, replace=False)
+    scraped = pd.DataFrame({
+        'seller_id': scraped_rows.astype(str).astype(object),
+        'name': np.array(names, dtype=object)[name_rows[scraped_rows]],
+        'mp_on_market': mp_on_market[scraped_rows] + rng.integers(-500, 500, len(scraped_rows)),
+        'market_with_mp': np.array(markets, dtype=object)[rng.integers(0, len(markets), len(scraped_rows))],
+    })
+    return values, scraped
+
+
+def read_legacy(values):
+    return build_typed_frame(values, COLUMNS, NUMERIC_COLUMNS, header_rows=0)
+
+
+def read_cast(values):
+    return apply_schema(build_typed_frame(values, COLUMNS, NUMERIC_COLUMNS, header_rows=0))
+
+
+def read_schema(values):
+    return build_typed_frame(values, COLUMNS, NUMERIC_COLUMNS, header_rows=0, schema=MM_SCHEMA)
+
+
+async def legacy_path(values, scraped):
+    updated = legacy_update(read_legacy(values), scraped)
+    return await compare_prices_and_create_for_update(updated, seed=0)
+
+
+def typed_path(read):
+    async def path(values, scraped):
+        updated = await update_dataframe(read(values), scraped)
+        return await compare_prices_and_create_for_update(updated, seed=0)
+    return path
+
+
+def traced_peak(func, *args):
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def measure(read, path, values, scraped):
+    """Время без tracemalloc (он замедляет выделение памяти), пики чтения и всей обработки отдельными запусками"""
+    started = time.perf_counter()
+    updated, for_update = asyncio.run(path(values, scraped))
+    seconds = time.perf_counter() - started
+    read_peak = traced_peak(read, values)
+    peak = traced_peak(lambda: asyncio.run(path(values, scraped)))
+    return updated, seconds, read_peak, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк памяти и времени обработки диапазона")
+    parser.add_argument("-n", "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    paths = [('исходный', read_legacy, legacy_path), ('приведение', read_cast, typed_path(read_cast)),
+             ('схема', read_schema, typed_path(read_schema))]
+    for rows in args.rows:
+        values, scraped = generate_data(rows)
+        results = [(label, *measure(read, path, values, scraped)) for label, read, path in paths]
+        legacy = results[0][1]
+        line = f"{rows:>9} строк:"
+        for label, updated, seconds, read_peak, peak in results:
+            same = np.array_equal(legacy['price'].to_numpy(dtype=float), updated['price'].to_numpy(dtype=float)) \
+                and np.array_equal(legacy['mp_on_market'].to_numpy(dtype=float),
+                                   updated['mp_on_market'].to_numpy(dtype=float)) \
+                and (legacy['market_with_mp'].astype(str).to_numpy() == updated['market_with_mp'].astype(str).to_numpy()).all()
+            line += f" | {label} {seconds:5.2f} с, пик чтения {read_peak:6.1f} МБ, пик {peak:6.1f} МБ, " \
+                    f"таблица {frame_mb(updated):5.1f} МБ{'' if same else ', ОТЛИЧАЕТСЯ'}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Бенчмарк расчёта новых цен compare_prices_and_create_for_update.
+
+Запуск:
+    python -m benchmarks.reprice_mm [-n 10000 100000 1000000]
+
+Сравнивает векторную реализацию с исходной (корутина на строку и построчная запись prim)
+и проверяет, что решения совпадают: те же строки на обновление, те же сообщения там,
+где цена не выбирается случайно, и новые цены в тех же границах.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from scr.update_data_mm import compare_prices_and_create_for_update
+
+
+async def legacy_compare(df):
+    """Исходная реализация compare_prices_and_create_for_update (без логирования строк)"""
+    updated_df = df.copy()
+    updated_df['prim'] = ''
+    for col in ['price', 'mp_on_market', 'stop']:
+        updated_df[col] = pd.to_numeric(updated_df[col], errors='coerce')
+
+    mask = (updated_df['price'] > updated_df['mp_on_market']) & (updated_df['mp_on_market'] > updated_df['stop'])
+
+    async def calculate_new_price(row):
+        old_price = row['price']
+        mp_on_market = row['mp_on_market']
+        stop = row['stop']
+        min_new_price = max(mp_on_market - 200, stop)
+        max_new_price = mp_on_market - 50
+        if min_new_price > max_new_price:
+            return old_price, f"Цена не изменена. Текущая цена: {old_price:.2f}, mp_on_market: {mp_on_market:.2f}, stop: {stop:.2f}"
+        new_price = max(random.randint(int(min_new_price), int(max_new_price)), int(stop))
+        return new_price, f"Цена изменена с {old_price:.2f} на {new_price:.2f} (mp_on_market: {mp_on_market:.2f})"
+
+    results = await asyncio.gather(*[calculate_new_price(row) for _, row in updated_df[mask].iterrows()])
+    if results:
+        new_prices, new_prims = zip(*results)
+        updated_df.loc[mask, 'price'] = new_prices
+        updated_df.loc[mask, 'prim'] = new_prims
+
+    for_update = updated_df[mask].copy()
+    for index, row in updated_df.iterrows():
+        if row['mp_on_market'] <= row['stop']:
+            updated_df.loc[index, 'prim'] = f"Оптимальная цена mp_on_market ({row['mp_on_market']:.2f}) ниже или равна минимальной stop ({row['stop']:.2f}) для товара с артикулом {row['seller_id']}"
+    return updated_df, for_update
+
+
+def generate_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    mp_on_market = rng.integers(500, 50000, rows).astype(float)
+    return pd.DataFrame({
+        'seller_id': np.arange(rows).astype(str),
+        'name': 'Товар',
+        'link': 'https://megamarket.ru/catalog/details/',
+        'price': mp_on_market + rng.integers(-300, 1000, rows),
+        'stop': mp_on_market - rng.integers(-100, 400, rows),
+        'mp_on_market': mp_on_market,
+        'market_with_mp': 'Магазин',
+        'prim': '',
+    })
+
+
+def same_decisions(df, expected, result):
+    """Совпадение решений с учётом того, что случайные цены у реализаций разные"""
+    updated, for_update = result
+    expected_updated, expected_for_update = expected
+    if not for_update.index.equals(expected_for_update.index):
+        return False
+    drawn = updated['prim'].str.startswith("Цена изменена").to_numpy()
+    if not np.array_equal(drawn, expected_updated['prim'].str.startswith("Цена изменена").to_numpy()):
+        return False
+    if not (updated['prim'][~drawn] == expected_updated['prim'][~drawn]).all():
+        return False
+    if not np.allclose(updated['price'][~drawn], expected_updated['price'][~drawn], equal_nan=True):
+        return False
+    mp_on_market, stop = df['mp_on_market'][drawn], df['stop'][drawn]
+    low = np.maximum(np.trunc(np.maximum(mp_on_market - 200, stop)), np.trunc(stop))
+    new_prices = updated['price'][drawn]
+    return bool(((new_prices >= low) & (new_prices <= np.trunc(mp_on_market - 50).clip(lower=low))).all())
+
+
+def timed(coro_func, *args, **kwargs):
+    started = time.perf_counter()
+    result = asyncio.run(coro_func(*args, **kwargs))
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк расчёта новых цен")
+    parser.add_argument("-n", "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--skip-legacy-above", type=int, default=100_000,
+                        help="Не запускать исходную реализацию на больших объёмах")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    for rows in args.rows:
+        df = generate_frame(rows)
+        result, seconds = timed(compare_prices_and_create_for_update, df, seed=0)
+        repeated, _ = timed(compare_prices_and_create_for_update, df, seed=0)
+        line = f"{rows:>9} строк: векторная {seconds:7.3f} с, " \
+               f"{'воспроизводима' if repeated[0].equals(result[0]) else 'НЕ ВОСПРОИЗВОДИМА'}"
+        if rows <= args.skip_legacy_above:
+            expected, legacy_seconds = timed(legacy_compare, df)
+            line += f", исходная {legacy_seconds:7.3f} с, x{legacy_seconds / seconds:6.1f}, " \
+                    f"{'совпадает' if same_decisions(df, expected, result) else 'ОТЛИЧАЕТСЯ'}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
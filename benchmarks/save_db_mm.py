@@ -0,0 +1,138 @@
+"""
+Бенчмарк записи в SQLite: save_to_database.
+
+Запуск:
+    python -m benchmarks.save_db_mm [-n 100000 300000] [--skip-legacy-above 100000]
+
+Для каждого объёма таблица сначала заполняется, затем синхронизируется с изменённым набором:
+10% строк изменено, 5% удалено, 5% добавлено. Исходная реализация (построчные UPDATE/INSERT/DELETE
+без индекса) сравнивается с пакетной; проверяется, что итоговые таблицы и счётчики совпадают.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from scr.data_fetcher import save_to_database
+from scr.logger import logger
+
+TABLE = 'product_data'
+
+
+def legacy_save(df, db_name, table, primary_key_cols):
+    """Исходная реализация save_to_database; возвращает (добавлено, обновлено, без изменений, удалено)"""
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    columns = ", ".join([f'"{col}"' for col in df.columns])
+    c.execute(f"CREATE TABLE IF NOT EXISTS '{table}' ({columns})")
+    key_where = ' AND '.join([f'"{col}"=?' for col in primary_key_cols])
+
+    c.execute(f"SELECT * FROM '{table}'")
+    existing_data = {tuple(row[:len(primary_key_cols)]): row for row in c.fetchall()}
+    updates = inserts = unchanged = deleted = 0
+    for index, row in df.iterrows():
+        key_values = tuple(str(row[col]) for col in primary_key_cols)
+        values = tuple(str(v) for v in row.tolist())
+        if key_values in existing_data:
+            if values != existing_data[key_values]:
+                placeholders = ", ".join([f'"{col}"=?' for col in df.columns])
+                c.execute(f"UPDATE '{table}' SET {placeholders} WHERE {key_where}", values + key_values)
+                updates += 1
+            else:
+                unchanged += 1
+            del existing_data[key_values]
+        else:
+            placeholders = ", ".join(["?"] * len(values))
+            c.execute(f"INSERT INTO '{table}' VALUES ({placeholders})", values)
+            inserts += 1
+    for key in existing_data.keys():
+        c.execute(f"DELETE FROM '{table}' WHERE {key_where}", key)
+        deleted += 1
+    conn.commit()
+    conn.close()
+    return inserts, updates, unchanged, deleted
+
+
+def generate_frames(rows, seed=0):
+    """Начальный набор и набор для синхронизации: 10% изменено, 5% удалено, 5% добавлено"""
+    rng = np.random.default_rng(seed)
+    initial = pd.DataFrame({
+        'seller_id': np.arange(rows).astype(str),
+        'name': np.char.add('Товар ', np.arange(rows).astype(str)),
+        'price': rng.integers(500, 50000, rows).astype(float),
+        'mp_on_market': rng.integers(500, 50000, rows).astype(float),
+        'market_with_mp': rng.choice(['Магазин 1', 'Магазин 2', 'Магазин 3'], rows),
+    })
+    changed = initial.drop(rng.choice(rows, rows // 20, replace=False))
+    update_rows = rng.choice(len(changed), rows // 10, replace=False)
+    changed.iloc[update_rows, changed.columns.get_loc('price')] += 1
+    added = initial.iloc[:rows // 20].assign(seller_id=np.arange(rows, rows + rows // 20).astype(str))
+    return initial, pd.concat([changed, added], ignore_index=True)
+
+
+def table_rows(db_name):
+    with sqlite3.connect(db_name) as conn:
+        return sorted(conn.execute(f"SELECT * FROM '{TABLE}'").fetchall())
+
+
+def bulk_save(df, db_name):
+    """save_to_database со счётчиками из его лога"""
+    stats = {}
+    original_info = logger.info
+
+    def capture(event, **kwargs):
+        if event == "update_complete":
+            stats.update(kwargs)
+        return original_info(event, **kwargs)
+
+    logger.info = capture
+    try:
+        asyncio.run(save_to_database(df, db_name, TABLE, ['seller_id']))
+    finally:
+        logger.info = original_info
+    return stats['inserted'], stats['updated'], stats['unchanged'], stats['deleted']
+
+
+def run(save, initial, changed, db_name):
+    """Время начальной записи и синхронизации, счётчики синхронизации и итоговая таблица"""
+    started = time.perf_counter()
+    save(initial, db_name)
+    first = time.perf_counter() - started
+    started = time.perf_counter()
+    counts = save(changed, db_name)
+    second = time.perf_counter() - started
+    return first, second, counts, table_rows(db_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк записи в SQLite")
+    parser.add_argument("-n", "--rows", type=int, nargs="+", default=[100_000, 300_000])
+    parser.add_argument("--skip-legacy-above", type=int, default=100_000,
+                        help="Не запускать исходную реализацию на больших объёмах")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            initial, changed = generate_frames(rows)
+            db_name = os.path.join(directory, f"bulk_{rows}.db")
+            first, second, counts, result = run(bulk_save, initial, changed, db_name)
+            line = f"{rows:>8} строк: пакетная запись {first:6.2f} с, синхронизация {second:6.2f} с, " \
+                   f"добавлено/обновлено/без изменений/удалено {counts}"
+            if rows <= args.skip_legacy_above:
+                legacy_db = os.path.join(directory, f"legacy_{rows}.db")
+                legacy = run(lambda df, db: legacy_save(df, db, TABLE, ['seller_id']), initial, changed, legacy_db)
+                same = legacy[2] == counts and legacy[3] == result
+                line += f" | исходная {legacy[0]:6.2f} с, {legacy[1]:6.2f} с, x{legacy[1] / second:6.1f}, " \
+                        f"{'совпадает' if same else 'ОТЛИЧАЕТСЯ'}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
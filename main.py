@@ -1,30 +1,48 @@
+import argparse
 import asyncio
+import os
 import random
-from typing import List, Tuple, Optional
+import socket
+import threading
+import time
+from functools import partial
+from typing import Dict, List, Tuple, Optional
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 from aiohttp import ClientError
 
 from scr.config import (
-    SAMPLE_SPREADSHEET_ID, TECH_PC_COMPONENTS_MM, KLICK_MARKET_MM, BY_MARKET_MM,
-    E_SHOPPER_MM, SSMART_SHOP_MM, ORIGINAL_MARKET_SHOP_MM
+    SAMPLE_SPREADSHEET_ID, CABINET_PAUSE_MINUTES, CYCLE_DEDUP, JOB_HEARTBEAT_SECONDS, JOB_POLL_SECONDS,
+    SCHEDULE_BATCH_WINDOW_MINUTES
 )
-from scr.data_fetcher import get_sheet_data
-from scr.data_writer import write_sheet_data
+from scr.data_fetcher import get_sheet_data, get_sheets_data
+from scr.data_writer import SheetWriteBatch
+from scr.fetch_planner_mm import CycleFetchPlanner
+from scr.http_fetch_mm import fetch_stats
+from scr.job_queue import JobQueue
 from scr.logger import logger
-from scr.parser_mm import scrape_megamarket
+from scr.parser_mm import iter_scraped_offers, scrape_megamarket
+from scr.pipeline import Pipeline
+from scr.pricing_rules_mm import get_rule_set
+from scr.rate_limit import scrape_limiter
+from scr.scheduler_mm import Scheduler, load_schedule
+from scr.schema_mm import MM_SCHEMA, FrameStats, apply_schema, price_column
 from scr.update_data_mm import compare_prices_and_create_for_update, update_dataframe
-from scr.update_mm import update_prices_mm
+from scr.update_mm import update_prices_mm, close_price_client
 
 # Глобальная переменная для режима отладки
 DEBUG = False
 
+MM_SHEET_COLUMNS = ['seller_id', 'name', 'link', 'price', 'stop', 'mp_on_market', 'market_with_mp', 'prim']
+MM_NUMERIC_COLUMNS = ['price', 'stop', 'mp_on_market']
+
 
 async def process_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     try:
-        df.columns = ['seller_id', 'name', 'link', 'price', 'stop', 'mp_on_market', 'market_with_mp', 'prim']
+        df.columns = MM_SHEET_COLUMNS
         return df.iloc[1:]
     except Exception as e:
         logger.error(f"Ошибка при обработке DataFrame: {str(e)}")
@@ -40,105 +58,321 @@ async def save_debug_csv(df: pd.DataFrame, filename: str) -> None:
             logger.error(f"Ошибка при сохранении отладочного CSV {filename}: {str(e)}")
 
 
-async def process_megamarket_range(
-        range_name: str,
-        sheet_range: str,
-        api_key: str,
-        executor: ThreadPoolExecutor
-) -> None:
+async def load_range_data(range_name: str, sheet_range: str) -> Optional[pd.DataFrame]:
     mm_logger = logger.bind(marketplace="MegaMarket", range=range_name)
     try:
-        mm_logger.info("Начало обработки диапазона")
+        df = await get_sheet_data(SAMPLE_SPREADSHEET_ID, sheet_range)
+        return await process_dataframe(df)
+    except Exception as e:
+        mm_logger.error(f"Ошибка при получении данных из Google Sheets: {str(e)}")
+        return None
 
-        df: Optional[pd.DataFrame] = None
-        try:
-            df = await get_sheet_data(SAMPLE_SPREADSHEET_ID, sheet_range)
-            df = await process_dataframe(df)
-        except Exception as e:
-            mm_logger.error(f"Ошибка при получении данных из Google Sheets: {str(e)}")
-            return
 
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        await save_debug_csv(df, f"report/{range_name}{current_time}_first.csv")
+async def read_range(range_name: str, sheet_range: str, api_key: str,
+                     planner: Optional[CycleFetchPlanner] = None,
+                     df: Optional[pd.DataFrame] = None) -> Optional[tuple]:
+    """Стадия чтения: данные диапазона из Google Sheets (если не прочитаны заранее пакетным запросом)"""
+    mm_logger = logger.bind(marketplace="MegaMarket", range=range_name)
+    mm_logger.info("Начало обработки диапазона")
+    if df is None:
+        # Пакетное чтение сразу создаёт колонки по схеме, отдельно прочитанный диапазон приводится здесь
+        df = await load_range_data(range_name, sheet_range)
+        if df is None:
+            return None
+        df = apply_schema(df)
+    if planner:
+        planner.register(range_name, df)
+
+    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+    await save_debug_csv(df, f"report/{range_name}{current_time}_first.csv")
+    return range_name, sheet_range, api_key, df, current_time
+
+
+async def scrape_range(item: tuple, executor: ThreadPoolExecutor,
+                       planner: Optional[CycleFetchPlanner] = None,
+                       cancelled: Optional[threading.Event] = None) -> Optional[tuple]:
+    """
+    Стадия загрузки: цены конкурентов для товаров диапазона через браузер.
+    cancelled останавливает загрузку в потоке, если обработку отменили.
+    """
+    range_name, sheet_range, api_key, df, current_time = item
+    mm_logger = logger.bind(marketplace="MegaMarket", range=range_name)
+    try:
+        # Журнал загрузки привязан к диапазону: прерванная загрузка диапазона продолжается с места остановки
+        offers_source = partial(planner.iter_offers if planner else iter_scraped_offers, run_id=range_name)
+        scraped_df = await asyncio.get_event_loop().run_in_executor(
+            executor, scrape_megamarket, df, offers_source, cancelled)
+        await save_debug_csv(scraped_df, f"report/{range_name}{current_time}_scraped.csv")
+    except Exception as e:
+        mm_logger.error(f"Ошибка при скрапинге данных: {str(e)}")
+        return None
+    return range_name, sheet_range, api_key, df, current_time, scraped_df
+
+
+def keep_submitted_prices(updated_df: pd.DataFrame, for_update_df: pd.DataFrame, results: list,
+                          sheet_prices: pd.Series) -> None:
+    """
+    Для строк, пропущенных журналом отправленных цен, в таблице остаётся цена до пересчёта.
+    Строка пропускается, только если эта цена совпадает с отправленной, поэтому цена,
+    которую журнал не отправлял (например, изменённая вручную), не перезаписывается.
+    """
+    sent = {offer_id for stats in results for offer_id in stats['offer_ids']}
+    skipped = for_update_df.index[~for_update_df['seller_id'].astype(str).isin(sent)]
+    if skipped.empty:
+        return
+    # Цены из таблицы могут быть дробными: колонка собирается заново, а не записывается в int64
+    prices = updated_df['price'].astype(float)
+    prices.loc[skipped] = sheet_prices.loc[skipped].astype(float)
+    updated_df['price'] = price_column(prices)
+    updated_df.loc[skipped, 'prim'] = "Цена не отправлена: цена конкурента не изменилась"
 
-        scraped_df: Optional[pd.DataFrame] = None
-        try:
-            scraped_df = await asyncio.get_event_loop().run_in_executor(executor, scrape_megamarket, df)
-            await save_debug_csv(scraped_df, f"report/{range_name}{current_time}_scraped.csv")
-        except Exception as e:
-            mm_logger.error(f"Ошибка при скрапинге данных: {str(e)}")
-            return
 
+def moved_share(df: pd.DataFrame, updated_df: pd.DataFrame) -> Optional[float]:
+    """Доля товаров, у которых цена конкурента изменилась относительно таблицы"""
+    if df.empty or len(df) != len(updated_df):
+        return None
+    before = pd.to_numeric(df['mp_on_market'], errors='coerce').to_numpy(dtype=float)
+    after = pd.to_numeric(updated_df['mp_on_market'], errors='coerce').to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        moved = (np.abs(after - before) >= 1) | (np.isnan(before) != np.isnan(after))
+    return float(moved.mean())
+
+
+async def finish_range(item: tuple, sheet_batch: SheetWriteBatch) -> Optional[float]:
+    """
+    Стадия завершения: сравнение цен, изменения для таблицы и обновление цен через API.
+    Возвращает долю товаров, у которых изменилась цена конкурента; при ошибке обработки диапазона
+    исключение передаётся дальше, и диапазон считается необработанным.
+    """
+    range_name, sheet_range, api_key, df, current_time, scraped_df = item
+    mm_logger = logger.bind(marketplace="MegaMarket", range=range_name)
+    frame_stats = FrameStats(len(df))
+    try:
         try:
             updated_df = await update_dataframe(df, scraped_df)
-            updated_df, for_update_df = await compare_prices_and_create_for_update(updated_df)
-            await write_sheet_data(updated_df, SAMPLE_SPREADSHEET_ID, sheet_range.replace('1', '3'))
+            frame_stats.stage('update', df, scraped_df, updated_df)
+            moved = moved_share(df, updated_df)
+            sheet_prices = updated_df['price']
+            updated_df, for_update_df = await compare_prices_and_create_for_update(
+                updated_df, rules=get_rule_set(range_name))
+            frame_stats.stage('compare', df, scraped_df, updated_df, for_update_df)
         except Exception as e:
             mm_logger.error(f"Ошибка при обновлении и сравнении данных: {str(e)}")
-            return
+            raise
 
         if not for_update_df.empty:
             mm_logger.info("Начало обновления цен через API", importance="high")
             try:
-                await update_prices_mm(for_update_df, api_key, "seller_id", "price", "isDeleted", debug=DEBUG)
+                results = await update_prices_mm(for_update_df, api_key, "seller_id", "price", "isDeleted",
+                                                 debug=DEBUG, cabinet=range_name, current_prices=sheet_prices)
+                if not DEBUG:
+                    keep_submitted_prices(updated_df, for_update_df, results, sheet_prices)
                 mm_logger.info("Завершено обновление цен через API")
             except ClientError as e:
                 mm_logger.error(f"Ошибка при обновлении цен через API: {str(e)}")
             except Exception as e:
                 mm_logger.error(f"Неожиданная ошибка при обновлении цен: {str(e)}")
+        frame_stats.stage('api')
+
+        # Изменения всех диапазонов записываются в таблицу одним запросом в конце цикла;
+        # сравниваются с прочитанными в этом цикле значениями, а не с прошлой записью
+        sheet_batch.add(updated_df, sheet_range.replace('1', '3'), df)
+        frame_stats.stage('sheet')
+        frame_stats.report(mm_logger)
 
         await save_debug_csv(updated_df, f"report/{range_name}{current_time}_updated.csv")
         await save_debug_csv(for_update_df, f"report/{range_name}{current_time}_for_update.csv")
 
         mm_logger.info(f"Обработка диапазона {range_name} завершена")
+        return moved
     except Exception as e:
-        mm_logger.error(f"Критическая ошибка при обработке диапазона{range_name}: {str(e)}", exc_info=True)
+        # Трассировку записывает конвейер; диапазон без результата считается необработанным
+        mm_logger.error(f"Критическая ошибка при обработке диапазона {range_name}: {str(e)}")
+        raise
 
 
-async def update_data_mm() -> None:
+async def update_data_mm(mm_ranges: Optional[List[Tuple[str, str, str]]] = None) -> Dict[str, Optional[float]]:
+    """
+    Обрабатывает диапазоны (название, диапазон таблицы, ключ API); по умолчанию - все кабинеты расписания.
+    Возвращает для каждого обработанного диапазона долю изменившихся цен конкурентов;
+    диапазонов, которые не удалось прочитать, загрузить или обработать, в результате нет.
+    """
     mm_logger = logger.bind(marketplace="MegaMarket")
+    fetch_stats.reset()
+    moved: Dict[str, Optional[float]] = {}
     try:
         mm_logger.warning("Начало обновления данных Mega Market")
-        mm_ranges: List[Tuple[str, str, str]] = [
-            ('ЮР1-Tech PC Components', 'MM_Tech_PC!A1:H', TECH_PC_COMPONENTS_MM),
-            ('ЮР1-Klick-Market', 'MM_KlickMarket!A1:H', KLICK_MARKET_MM),
-            ('ЮР2-ByMarket', 'MM_ByMarket!A1:H', BY_MARKET_MM),
-            ('ЮР2-E-Shopper', 'MM_E-Shoper!A1:H', E_SHOPPER_MM),
-            ('ЮР3-SSmart_shop', 'MM_SSmart_Shop!A1:H', SSMART_SHOP_MM),
-            ('ЮР3-Original_Market', 'MM_Original_MS!A1:H', ORIGINAL_MARKET_SHOP_MM)
-        ]
-
-        with ThreadPoolExecutor() as executor:
-            for i, (range_name, sheet_range, api_key) in enumerate(mm_ranges):
-                if i > 0:
-                    pause_duration = random.uniform(25 * 60, 40 * 60)
-                    mm_logger.info(f"Пауза перед обработкой {range_name}: {pause_duration / 60:.2f} минут")
+        if mm_ranges is None:
+            mm_ranges = [cabinet.range_tuple for cabinet in load_schedule()]
+
+        # Каждая карточка товара загружается один раз за цикл для всех кабинетов
+        planner: Optional[CycleFetchPlanner] = CycleFetchPlanner() if CYCLE_DEDUP else None
+        scraped_ranges = 0
+
+        # Все диапазоны читаются одним запросом; при ошибке каждый диапазон читается отдельно
+        frames = await get_sheets_data(SAMPLE_SPREADSHEET_ID, [sheet_range for _, sheet_range, _ in mm_ranges],
+                                       MM_SHEET_COLUMNS, MM_NUMERIC_COLUMNS, schema=MM_SCHEMA) or {}
+
+        sheet_batch = SheetWriteBatch(SAMPLE_SPREADSHEET_ID)
+
+        async def finish(item):
+            moved[item[0]] = await finish_range(item, sheet_batch)
+
+        async def read(item):
+            return await read_range(*item, planner=planner, df=frames.pop(item[1], None))
+
+        async def scrape(item):
+            nonlocal scraped_ranges
+            if scraped_ranges:
+                # Пауза задерживает только загрузку: чтение и запись других диапазонов продолжаются
+                pause_duration = max(random.uniform(*CABINET_PAUSE_MINUTES) * 60,
+                                     scrape_limiter.max_backoff_remaining())
+                if pause_duration > 0:
+                    mm_logger.info(f"Пауза перед обработкой {item[0]}: {pause_duration / 60:.2f} минут")
                     await asyncio.sleep(pause_duration)
+            scraped_ranges += 1
+            return await scrape_range(item, executor, planner, cancelled)
 
-                await process_megamarket_range(range_name, sheet_range, api_key, executor)
+        # Пока загружается диапазон N, диапазон N+1 уже читается, а N-1 записывается и отправляется в API
+        pipeline = Pipeline()
+        executor = ThreadPoolExecutor()
+        cancelled = threading.Event()
+        try:
+            await pipeline.run(mm_ranges, ('read', read), ('scrape', scrape), ('finish', finish))
+        except asyncio.CancelledError:
+            # Отмена (например, аренда задания потеряна) останавливает и загрузку в потоке
+            cancelled.set()
+            raise
+        finally:
+            # При отмене цикл событий не ждёт поток загрузки: он остановится сам между товарами
+            executor.shutdown(wait=not cancelled.is_set(), cancel_futures=True)
+        await sheet_batch.flush()
 
+        pipeline.report(mm_logger)
+        if planner:
+            planner.log_plan(mm_logger)
+            planner.report(mm_logger)
+        fetch_stats.report(mm_logger)
         mm_logger.info("Обновление данных Mega Market успешно завершено")
     except Exception as e:
         mm_logger.error(f"Критическая ошибка при обновлении данных Mega Market: {str(e)}", exc_info=True)
+    return moved
+
+
+async def run_cabinets(scheduler: Scheduler, cabinets: list) -> None:
+    moved: Dict[str, Optional[float]] = {}
+    try:
+        logger.info("Начало цикла обновления данных для ММ", cabinets=[cabinet.name for cabinet in cabinets])
+        moved = await update_data_mm([cabinet.range_tuple for cabinet in cabinets])
+        logger.info("Цикл обновления данных для всех маркетплейсов успешно завершен")
+    except Exception as e:
+        logger.warning(f"Критическая ошибка в цикле обновления данных: {str(e)}")
+    finally:
+        for cabinet in cabinets:
+            scheduler.finish(cabinet, moved.get(cabinet.name))
 
 
 async def update_loop() -> None:
+    """
+    Запускает кабинеты по расписанию по одному циклу за раз: кабинеты, подошедшие в пределах
+    SCHEDULE_BATCH_WINDOW_MINUTES, обрабатываются одним циклом update_data_mm (общий план загрузки
+    и статистика, паузы между кабинетами), а подошедшие во время цикла ждут его завершения.
+    """
+    scheduler = Scheduler(load_schedule())
+    while True:
+        due = scheduler.due(time.time() + SCHEDULE_BATCH_WINDOW_MINUTES * 60)
+        if due:
+            scheduler.start(due)
+            await run_cabinets(scheduler, due)
+            continue
+        await scheduler.wait()
+
+
+async def coordinator_loop() -> None:
+    """Ставит подошедшие по расписанию кабинеты в очередь заданий и принимает результаты воркеров"""
+    scheduler = Scheduler(load_schedule())
+    queue = JobQueue()
+    jobs = {}
     while True:
+        for cabinet in scheduler.due():
+            # Если задание кабинета уже в очереди (например, после перезапуска координатора), ждём его
+            job_id = await asyncio.to_thread(queue.enqueue, 'range', cabinet.name, cabinet.job_payload)
+            scheduler.start([cabinet])
+            jobs[job_id] = cabinet
+            logger.info(f"Задание {job_id} для {cabinet.name} поставлено в очередь")
+
+        finished = await asyncio.to_thread(queue.finished, list(jobs))
+        for job_id, (status, result) in finished.items():
+            cabinet = jobs.pop(job_id)
+            if status != 'done':
+                logger.error(f"Задание {job_id} для {cabinet.name} завершилось с ошибкой")
+            scheduler.finish(cabinet, (result or {}).get('moved'))
+
+        next_run = scheduler.seconds_until_next()
+        await asyncio.sleep(JOB_POLL_SECONDS if next_run is None else min(JOB_POLL_SECONDS, next_run))
+
+
+async def keep_lease(queue: JobQueue, job_id: int, worker_id: str, job: asyncio.Task) -> None:
+    """Продлевает аренду задания; если её забрал другой воркер, прерывает задание"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        if not await asyncio.to_thread(queue.heartbeat, job_id, worker_id):
+            logger.warning(f"Аренда задания {job_id} потеряна, задание прерывается")
+            job.cancel()
+            return
+
+
+async def worker_loop(worker_id: str) -> None:
+    """Забирает задания из очереди и обрабатывает диапазоны, продлевая аренду во время работы"""
+    queue = JobQueue()
+    logger.info(f"Воркер {worker_id} запущен")
+    while True:
+        job = await asyncio.to_thread(queue.claim, worker_id)
+        if job is None:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+
+        job_id, kind, payload = job
+        name = payload['name']
+        logger.info(f"Воркер {worker_id} взял задание {job_id}: {name}")
+        task = asyncio.create_task(update_data_mm([(name, payload['sheet_range'], os.getenv(payload['api_key_env']))]))
+        lease = asyncio.create_task(keep_lease(queue, job_id, worker_id, task))
         try:
-            logger.info("Начало цикла обновления данных для ММ")
-            await update_data_mm()
-            logger.info("Цикл обновления данных для всех маркетплейсов успешно завершен")
+            moved = await task
+            if name in moved:
+                await asyncio.to_thread(queue.complete, job_id, worker_id, {'moved': moved[name]})
+            else:
+                logger.error(f"Задание {job_id}: диапазон {name} не обработан")
+                await asyncio.to_thread(queue.fail, job_id, worker_id, f"диапазон {name} не обработан")
+        except asyncio.CancelledError:
+            # Задание прервано из-за потерянной аренды - его уже обрабатывает другой воркер;
+            # отмена самого воркера передаётся дальше
+            if not lease.done() or lease.cancelled():
+                raise
         except Exception as e:
-            logger.warning(f"Критическая ошибка в цикле обновления данных: {str(e)}")
-        # logger.warning(f"Ожидание {UPDATE_INTERVAL_MINUTES} минут до следующего обновления")
-        # await asyncio.sleep(UPDATE_INTERVAL_MINUTES * 60)
+            logger.error(f"Ошибка задания {job_id}: {str(e)}", exc_info=True)
+            await asyncio.to_thread(queue.fail, job_id, worker_id, e)
+        finally:
+            lease.cancel()
 
 
-async def main() -> None:
-    await update_loop()
+async def main(mode: str = 'standalone', worker_id: Optional[str] = None) -> None:
+    try:
+        if mode == 'coordinator':
+            await coordinator_loop()
+        elif mode == 'worker':
+            await worker_loop(worker_id or f"{socket.gethostname()}:{os.getpid()}")
+        else:
+            await update_loop()
+    finally:
+        await close_price_client()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
-
-
+    parser = argparse.ArgumentParser(description="Обновление цен МегаМаркета")
+    parser.add_argument('--mode', choices=['standalone', 'coordinator', 'worker'], default='standalone',
+                        help="standalone - всё в одном процессе; coordinator - только расписание и очередь "
+                             "заданий; worker - обработка заданий из очереди")
+    parser.add_argument('--worker-id', help="идентификатор воркера (по умолчанию хост:pid)")
+    args = parser.parse_args()
+    asyncio.run(main(args.mode, args.worker_id))
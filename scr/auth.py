@@ -1,13 +1,42 @@
+import asyncio
 import os.path
+from datetime import datetime, timedelta, timezone
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+from .config import CREDENTIALS_REFRESH_MARGIN_MINUTES
 from .logger import logger
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
+# Учетные данные процесса: token.json читается с диска только при первом обращении
+_creds = None
+_creds_lock = asyncio.Lock()
+
+
+def expires_soon(creds, margin_minutes=CREDENTIALS_REFRESH_MARGIN_MINUTES):
+    """Истекает ли токен в ближайшие margin_minutes (expiry в google-auth - наивное UTC-время)"""
+    if not creds.expiry:
+        return False
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return creds.expiry - now < timedelta(minutes=margin_minutes)
+
 
 async def get_credentials():
+    global _creds
+    creds = _creds
+    if creds and creds.valid and not expires_soon(creds):
+        return creds
+
+    async with _creds_lock:
+        creds = _creds
+        if creds and creds.valid and not expires_soon(creds):
+            return creds
+        _creds = await load_credentials(creds)
+        return _creds
+
+
+async def load_credentials(creds=None):
     logger.info("Запуск функции get_credentials")
 
     # Получаем абсолютный путь к директории, где находится этот скрипт
@@ -17,18 +46,18 @@ async def get_credentials():
     token_path = os.path.join(script_dir, "acsess/token.json")
     credentials_path = os.path.join(script_dir, "acsess/credentials.json")
 
-    creds = None
-    if os.path.exists(token_path):
+    if creds is None and os.path.exists(token_path):
         logger.debug(f"Найден существующий файл token.json: {token_path}")
         creds = Credentials.from_authorized_user_file(token_path, SCOPES)
         logger.info("Загружены учетные данные из token.json")
 
-    if not creds or not creds.valid:
-        logger.info("Учетные данные отсутствуют или недействительны")
-        if creds and creds.expired and creds.refresh_token:
-            logger.info("Обновление просроченных учетных данных")
+    if not creds or not creds.valid or expires_soon(creds):
+        logger.info("Учетные данные отсутствуют, недействительны или скоро истекут")
+        if creds and creds.refresh_token:
+            logger.info("Обновление учетных данных")
             try:
-                creds.refresh(Request())
+                # Запрос к серверу авторизации выполняется вне цикла событий
+                await asyncio.to_thread(creds.refresh, Request())
                 logger.info("Учетные данные успешно обновлены")
             except Exception as e:
                 logger.error(f"Не удалось обновить учетные данные: {str(e)}")
@@ -56,4 +85,3 @@ async def get_credentials():
 
     logger.info("Учетные данные успешно получены")
     return creds
-
@@ -31,6 +31,109 @@ E_SHOPPER_MM = os.getenv('E_SHOPPER_MM')
 SSMART_SHOP_MM = os.getenv('SSMART_SHOP_MM')
 ORIGINAL_MARKET_SHOP_MM = os.getenv('ORIGINAL_MARKET_SHOP_MM')
 
+# Расписание кабинетов: интервалы, разброс и диапазоны таблицы
+SCHEDULE_FILE = os.getenv('SCHEDULE_FILE', os.path.join(current_dir, '..', 'schedule_mm.json'))
+# Кабинеты, которым пора запускаться в пределах этого окна, обрабатываются одним циклом
+SCHEDULE_BATCH_WINDOW_MINUTES = float(os.getenv('SCHEDULE_BATCH_WINDOW_MINUTES', 2))
+
+# Строковые колонки диапазонов на Arrow (нужен pyarrow): меньше памяти на больших диапазонах
+MM_ARROW_STRINGS = os.getenv('MM_ARROW_STRINGS', '0') == '1'
+
+# Правила расчёта цен: набор по умолчанию и наборы отдельных кабинетов
+PRICING_RULES_FILE = os.getenv('PRICING_RULES_FILE', os.path.join(current_dir, '..', 'pricing_rules_mm.json'))
+
+# Очередь заданий для режимов coordinator/worker (файл SQLite, общий для всех воркеров)
+JOB_QUEUE_DB = os.getenv('JOB_QUEUE_DB', 'jobs.db')
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 600))  # задание без продления аренды забирает другой воркер
+JOB_HEARTBEAT_SECONDS = int(os.getenv('JOB_HEARTBEAT_SECONDS', 60))
+JOB_POLL_SECONDS = int(os.getenv('JOB_POLL_SECONDS', 10))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+# Google Sheets API
+SHEETS_HTTP_TIMEOUT = int(os.getenv('SHEETS_HTTP_TIMEOUT', 60))
+# Учетные данные обновляются заранее, если до истечения осталось меньше N минут
+CREDENTIALS_REFRESH_MARGIN_MINUTES = int(os.getenv('CREDENTIALS_REFRESH_MARGIN_MINUTES', 5))
+
+# API цен МегаМаркета
+MM_API_BASE_URL = os.getenv('MM_API_BASE_URL', 'https://api.megamarket.tech')
+MM_PRICE_BATCH_SIZE = int(os.getenv('MM_PRICE_BATCH_SIZE', 300))  # цен в одном запросе
+MM_PRICE_CONCURRENCY = int(os.getenv('MM_PRICE_CONCURRENCY', 2))  # одновременных запросов
+MM_PRICE_RETRIES = int(os.getenv('MM_PRICE_RETRIES', 3))  # повторов неудачной пачки
+MM_PRICE_BACKOFF_SECONDS = float(os.getenv('MM_PRICE_BACKOFF_SECONDS', 2))
+MM_API_TIMEOUT = int(os.getenv('MM_API_TIMEOUT', 30))
+# Цена не отправляется повторно, пока цена конкурента и stop не изменились (но не дольше N часов)
+PRICE_LEDGER_MAX_AGE_HOURS = float(os.getenv('PRICE_LEDGER_MAX_AGE_HOURS', 24))
+PRICE_LEDGER_TOLERANCE = float(os.getenv('PRICE_LEDGER_TOLERANCE', 1))  # рублей
+
+# Парсер ММ
+PARSER_WORKERS = int(os.getenv('PARSER_WORKERS', 1))  # количество параллельных браузеров
+# Во сколько раз планировщик может поднять частоту запросов к хосту относительно начальной
+PARSER_MAX_RATE_MULTIPLIER = float(os.getenv('PARSER_MAX_RATE_MULTIPLIER', 1))
+
+# Планировщик запросов к страницам товаров (общий для всех браузеров и HTTP-загрузки)
+SCRAPE_RATE_PER_MINUTE = float(os.getenv('SCRAPE_RATE_PER_MINUTE', 6))  # начальная частота запросов к хосту
+SCRAPE_RATE_MIN_PER_MINUTE = float(os.getenv('SCRAPE_RATE_MIN_PER_MINUTE', 1))
+SCRAPE_RATE_MAX_PER_MINUTE = SCRAPE_RATE_PER_MINUTE * PARSER_MAX_RATE_MULTIPLIER
+SCRAPE_RATE_JITTER = float(os.getenv('SCRAPE_RATE_JITTER', 0.3))  # случайное отклонение паузы, доля
+SCRAPE_BACKOFF_SECONDS = float(os.getenv('SCRAPE_BACKOFF_SECONDS', 60))  # пауза после первой ошибки, удваивается
+SCRAPE_BACKOFF_MAX_SECONDS = float(os.getenv('SCRAPE_BACKOFF_MAX_SECONDS', 1800))
+SCRAPE_SPEEDUP_AFTER = int(os.getenv('SCRAPE_SPEEDUP_AFTER', 10))  # успешных запросов подряд до ускорения
+# пауза между прокрутками страницы
+SCROLL_PAUSE_SECONDS = (float(os.getenv('SCROLL_PAUSE_MIN_SECONDS', 1)),
+                        float(os.getenv('SCROLL_PAUSE_MAX_SECONDS', 3)))
+# Пауза между кабинетами, минут (дополнительно ждём окончания паузы планировщика после ошибок)
+CABINET_PAUSE_MINUTES = (float(os.getenv('CABINET_PAUSE_MIN_MINUTES', 0)),
+                         float(os.getenv('CABINET_PAUSE_MAX_MINUTES', 0)))
+# Загружать каждую карточку товара один раз за цикл для всех кабинетов
+CYCLE_DEDUP = os.getenv('CYCLE_DEDUP', '1') == '1'
+# Диапазонов в очереди между стадиями чтения, загрузки и записи
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 1))
+# Режим загрузки страниц: browser - только браузер, http_first - сначала HTTP, браузер только при необходимости
+FETCH_MODE = os.getenv('FETCH_MODE', 'browser')
+HTTP_CONCURRENCY = int(os.getenv('HTTP_CONCURRENCY', 4))  # одновременных HTTP-запросов
+HTTP_TIMEOUT = int(os.getenv('HTTP_TIMEOUT', 30))  # таймаут HTTP-запроса, секунд
+# Парсер предложений: bs4, lxml или selectolax; EXTRACTOR_OFFERS_ONLY - разбирать только блок предложений
+EXTRACTOR_BACKEND = os.getenv('EXTRACTOR_BACKEND', 'bs4')
+EXTRACTOR_OFFERS_ONLY = os.getenv('EXTRACTOR_OFFERS_ONLY', '1') == '1'
+# Процессов для разбора страниц параллельно с загрузкой; 0 - разбор в потоке загрузки
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES', 2))
+STREAM_BUFFER_PAGES = int(os.getenv('STREAM_BUFFER_PAGES', 4))  # страниц в памяти в ожидании разбора
+
+# Приоритетная проверка товаров
+SCRAPE_BUDGET_FRACTION = float(os.getenv('SCRAPE_BUDGET_FRACTION', 1.0))  # доля товаров диапазона за цикл
+SKU_MIN_REFRESH_HOURS = float(os.getenv('SKU_MIN_REFRESH_HOURS', 1))  # интервал проверки часто меняющихся товаров
+SKU_MAX_REFRESH_HOURS = float(os.getenv('SKU_MAX_REFRESH_HOURS', 24))  # интервал проверки стабильных товаров
+SKU_RECENT_CHANGE_DAYS = float(os.getenv('SKU_RECENT_CHANGE_DAYS', 7))
+SKU_NEAR_STOP_PERCENT = float(os.getenv('SKU_NEAR_STOP_PERCENT', 5))  # цена конкурента не дальше N% от stop
+
+# Кэш загруженных страниц товаров
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', '1') == '1'
+PAGE_CACHE_DIR = os.getenv('PAGE_CACHE_DIR', 'report/page_cache')
+PAGE_CACHE_TTL_MINUTES = int(os.getenv('PAGE_CACHE_TTL_MINUTES', 60))  # страницы моложе TTL не загружаются повторно
+PAGE_CACHE_MAX_MB = int(os.getenv('PAGE_CACHE_MAX_MB', 1024))
+PAGE_CACHE_KEEP_DAYS = int(os.getenv('PAGE_CACHE_KEEP_DAYS', 7))
+
+# Журнал загрузки: после перезапуска прерванной загрузки диапазона уже разобранные ссылки не загружаются повторно
+SCRAPE_JOURNAL_ENABLED = os.getenv('SCRAPE_JOURNAL_ENABLED', '1') == '1'
+SCRAPE_JOURNAL_RESUME_MINUTES = int(os.getenv('SCRAPE_JOURNAL_RESUME_MINUTES', 60))
+SCRAPE_JOURNAL_BATCH = int(os.getenv('SCRAPE_JOURNAL_BATCH', 20))  # записей в одной транзакции
+SCRAPE_JOURNAL_FLUSH_SECONDS = float(os.getenv('SCRAPE_JOURNAL_FLUSH_SECONDS', 30))
+
+# Браузер
+GECKODRIVER_PATH = os.getenv('GECKODRIVER_PATH')  # путь к geckodriver; если не задан - скачивается один раз за процесс
+DRIVER_MAX_PAGES = int(os.getenv('DRIVER_MAX_PAGES', 200))  # перезапуск браузера после N страниц
+DRIVER_MAX_RSS_MB = int(os.getenv('DRIVER_MAX_RSS_MB', 1500))  # перезапуск браузера при превышении памяти
+# Облегчённый профиль: без картинок, шрифтов, видео и трекеров
+LEAN_BROWSING = os.getenv('LEAN_BROWSING', '1') == '1'
+PAGE_LOAD_STRATEGY = os.getenv('PAGE_LOAD_STRATEGY', 'eager')  # normal, eager или none
+# Хосты рекламы и аналитики, запросы к которым блокируются в облегчённом профиле
+BLOCKED_HOSTS = [
+    'mc.yandex.ru', 'an.yandex.ru', 'top-fwz1.mail.ru', 'ad.mail.ru',
+    'www.google-analytics.com', 'www.googletagmanager.com', 'googleads.g.doubleclick.net',
+    'stats.g.doubleclick.net', 'connect.facebook.net', 'vk.com', 'counter.yadro.ru',
+    'static.criteo.net', 'sslwidget.criteo.com', 'cdn.mxpnl.com', 'api.flocktory.com',
+]
+
 
 
 # Яндекс маркет
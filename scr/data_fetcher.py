@@ -1,18 +1,18 @@
+import asyncio
 import pandas as pd
-from .auth import get_credentials
-from googleapiclient.discovery import build
+from .sheets_client import sheets_service, execute
 import sqlite3
 import traceback
 from .logger import logger  # Импорт логгера
+from .schema_mm import typed_column
 
 async def get_sheet_data(spreadsheet_id, range_name):
     """Получает данные из Google Sheets и возвращает их в виде pandas DataFrame"""
-    creds = await get_credentials()
-    service = build('sheets', 'v4', credentials=creds)
+    service = await sheets_service()
 
     try:
-        result = service.spreadsheets().values().get(spreadsheetId=spreadsheet_id,
-                                                    range=range_name).execute()
+        result = await execute(service.spreadsheets().values().get(spreadsheetId=spreadsheet_id,
+                                                                   range=range_name))
         values = result.get('values', [])
     except Exception as e:
         logger.error("google_sheets_error", error=str(e))
@@ -23,61 +23,148 @@ async def get_sheet_data(spreadsheet_id, range_name):
     df = df.fillna("Нет значения")
     return df
 
-async def save_to_database(df, db_name, product_data_table='product_data_ozon1', primary_key_cols=None):
-    """Записывает данные из DataFrame в таблицу базы данных, обновляя и удаляя существующие записи"""
-    conn = None
-    try:
-        logger.info("database_update_start", table=product_data_table, dataframe_size=len(df))
 
-        conn = sqlite3.connect(db_name)
-        c = conn.cursor()
+def cell_text(value):
+    """Текст ячейки без дробной части у целых чисел (артикулы приходят числами)"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def build_typed_frame(values, columns, numeric_columns=(), header_rows=2, schema=None):
+    """
+    DataFrame из строк таблицы без заголовков: числовые колонки - float, остальные - текст.
+    Sheets обрезает пустые ячейки в конце строки, поэтому короткие строки дополняются.
+    Со схемой ({колонка: тип}, см. schema_mm) колонки сразу создаются нужного типа
+    по одной из значений ответа, без промежуточной таблицы из объектов.
+    """
+    rows = values[header_rows:]
+    data = {}
+    for i, col in enumerate(columns):
+        cells = [row[i] if i < len(row) else None for row in rows]
+        if col not in numeric_columns:
+            cells = ["Нет значения" if v is None or v == "" else cell_text(v) for v in cells]
+        kind = schema.get(col) if schema else None
+        if kind:
+            data[col] = typed_column(cells, kind)
+        elif col in numeric_columns:
+            data[col] = pd.to_numeric(pd.Series(cells, dtype=object), errors='coerce')
+        else:
+            data[col] = pd.Series(cells, dtype=object)
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+async def get_sheets_data(spreadsheet_id, ranges, columns, numeric_columns=(), header_rows=2, schema=None):
+    """
+    Читает все диапазоны одним запросом values.batchGet с неформатированными значениями.
+    Возвращает {диапазон: DataFrame} с типизированными колонками (по схеме, если она задана) или None при ошибке.
+    """
+    service = await sheets_service()
+
+    try:
+        request = service.spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id, ranges=list(ranges),
+                                                           valueRenderOption='UNFORMATTED_VALUE',
+                                                           dateTimeRenderOption='FORMATTED_STRING')
+        result = await execute(request)
+    except Exception as e:
+        logger.error("google_sheets_error", error=str(e))
+        return None
 
+    # Диапазоны в ответе идут в порядке запроса
+    value_ranges = result.get('valueRanges', [])
+    return {range_name: build_typed_frame(value_range.get('values', []), columns, numeric_columns, header_rows,
+                                               schema)
+            for range_name, value_range in zip(ranges, value_ranges)}
+
+def quote(name):
+    """Имя таблицы или колонки для SQL"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sync_table(conn, rows, columns, table, key_cols):
+    """
+    Синхронизирует таблицу с rows одной транзакцией: строки загружаются во временную таблицу
+    через executemany, затем изменения применяются запросами над множествами строк
+    (INSERT ... ON CONFLICT DO UPDATE и DELETE ... WHERE NOT EXISTS).
+    Возвращает (добавлено, обновлено, без изменений, удалено, записей в таблице до синхронизации).
+    """
+    names = ", ".join(quote(col) for col in columns)
+    keys = ", ".join(quote(col) for col in key_cols)
+    key_match = " AND ".join(f"t.{quote(col)} = s.{quote(col)}" for col in key_cols)
+    differs = " OR ".join(f"t.{quote(col)} IS NOT s.{quote(col)}" for col in columns)
+    index = quote(f"{table}_key")
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
         logger.info("creating_table_if_not_exists")
-        columns = ", ".join([f'"{col}"' for col in df.columns])
-        c.execute(f"CREATE TABLE IF NOT EXISTS '{product_data_table}' ({columns})")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {quote(table)} ({names})")
+        existing = conn.execute(f"SELECT COUNT(*) FROM {quote(table)}").fetchone()[0]
+        logger.info("existing_records_count", count=existing)
+
+        has_index = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                                 (f"{table}_key",)).fetchone()
+        if not has_index:
+            # Таблицы, созданные до уникального индекса, могли накопить повторы ключа: остаётся последняя запись
+            conn.execute(f"DELETE FROM {quote(table)} WHERE rowid NOT IN "
+                         f"(SELECT MAX(rowid) FROM {quote(table)} GROUP BY {keys})")
+            conn.execute(f"CREATE UNIQUE INDEX {index} ON {quote(table)} ({keys})")
+
+        conn.execute(f"CREATE TEMP TABLE staging ({names})")
+        conn.executemany(f"INSERT INTO staging VALUES ({', '.join('?' * len(columns))})", rows)
+        conn.execute(f"CREATE UNIQUE INDEX temp.staging_key ON staging ({keys})")
+
+        inserts = conn.execute(f"SELECT COUNT(*) FROM staging s WHERE NOT EXISTS "
+                               f"(SELECT 1 FROM {quote(table)} t WHERE {key_match})").fetchone()[0]
+        deleted = conn.execute(f"DELETE FROM {quote(table)} AS t WHERE NOT EXISTS "
+                               f"(SELECT 1 FROM staging s WHERE {key_match})").rowcount
+        assignments = ", ".join(f"{quote(col)} = excluded.{quote(col)}" for col in columns)
+        changed = " OR ".join(f"{quote(col)} IS NOT excluded.{quote(col)}" for col in columns)
+        upserted = conn.execute(f"INSERT INTO {quote(table)} ({names}) SELECT {names} FROM staging WHERE true "
+                                f"ON CONFLICT ({keys}) DO UPDATE SET {assignments} WHERE {changed}").rowcount
+        conn.execute("DROP TABLE temp.staging")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    updates = upserted - inserts
+    return inserts, updates, len(rows) - inserts - updates, deleted, existing
+
+
+async def save_to_database(df, db_name, product_data_table='product_data_ozon1', primary_key_cols=None):
+    """
+    Записывает данные из DataFrame в таблицу базы данных, обновляя и удаляя существующие записи.
+    Значения хранятся текстом; при повторе ключа в DataFrame сохраняется последняя строка.
+    """
+    try:
+        logger.info("database_update_start", table=product_data_table, dataframe_size=len(df))
 
         if primary_key_cols is None:
             primary_key_cols = [df.columns[0]]
         logger.info("primary_keys", keys=primary_key_cols)
 
-        logger.info("fetching_existing_records")
-        c.execute(f"SELECT * FROM '{product_data_table}'")
-        existing_data = {tuple(row[:len(primary_key_cols)]): row for row in c.fetchall()}
-        logger.info("existing_records_count", count=len(existing_data))
-
-        updates = inserts = unchanged = deleted = 0
-
-        logger.info("processing_records_start")
-        for index, row in df.iterrows():
-            key_values = tuple(str(row[col]) for col in primary_key_cols)
-            values = tuple(str(v) for v in row.tolist())
-
-            if key_values in existing_data:
-                if values != existing_data[key_values]:
-                    placeholders = ", ".join([f'"{col}"=?' for col in df.columns])
-                    c.execute(
-                        f"UPDATE '{product_data_table}' SET {placeholders} WHERE {' AND '.join([f'"{col}"=?' for col in primary_key_cols])}",
-                        values + key_values)
-                    updates += 1
-                else:
-                    unchanged += 1
-                del existing_data[key_values]
-            else:
-                placeholders = ", ".join(["?"] * len(values))
-                c.execute(f"INSERT INTO '{product_data_table}' VALUES ({placeholders})", values)
-                inserts += 1
-
-            if index % 1000 == 0:
-                logger.info("processing_progress", records_processed=index + 1)
-
-        logger.info("deleting_missing_records")
-        for key in existing_data.keys():
-            c.execute(
-                f"DELETE FROM '{product_data_table}' WHERE {' AND '.join([f'"{col}"=?' for col in primary_key_cols])}",
-                key)
-            deleted += 1
-
-        conn.commit()
+        columns = list(df.columns)
+        key_positions = [columns.index(col) for col in primary_key_cols]
+        rows = {}
+        for row in df.itertuples(index=False, name=None):
+            values = tuple(str(v) for v in row)
+            rows[tuple(values[i] for i in key_positions)] = values
+
+        def sync():
+            conn = sqlite3.connect(db_name, isolation_level=None)
+            try:
+                conn.executescript("""
+                    PRAGMA journal_mode = WAL;
+                    PRAGMA synchronous = NORMAL;
+                    PRAGMA temp_store = MEMORY;
+                    PRAGMA cache_size = -65536;
+                """)
+                return sync_table(conn, list(rows.values()), columns, product_data_table, primary_key_cols)
+            finally:
+                conn.close()
+                logger.info("database_connection_closed")
+
+        inserts, updates, unchanged, deleted, existing = await asyncio.to_thread(sync)
         logger.info("database_changes_committed")
 
         total_records = max(len(df) + deleted, 1)
@@ -95,9 +182,3 @@ async def save_to_database(df, db_name, product_data_table='product_data_ozon1',
         logger.error("database_update_error",
                      error=str(e),
                      traceback=traceback.format_exc())
-    finally:
-        if conn:
-            conn.close()
-            logger.info("database_connection_closed")
-
-
@@ -1,9 +1,8 @@
 
-import asyncio
+import re
 import pandas as pd
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from .auth import get_credentials
+from .sheets_client import sheets_service, execute
 from .logger import logger  # Импорт логгера
 
 
@@ -12,10 +11,8 @@ async def write_sheet_data(df, spreadsheet_id, range_name):
                 spreadsheet_id=spreadsheet_id,
                 range_name=range_name)
 
-    creds = await get_credentials()
-
     try:
-        service = build("sheets", "v4", credentials=creds)
+        service = await sheets_service()
 
         # Заполняем пустые значения в DataFrame
         df = df.fillna('')
@@ -28,7 +25,6 @@ async def write_sheet_data(df, spreadsheet_id, range_name):
             "values": data
         }
 
-        # Выполняем синхронный вызов в потоке
         request = service.spreadsheets().values().update(
             spreadsheetId=spreadsheet_id,
             range=range_name,
@@ -38,7 +34,7 @@ async def write_sheet_data(df, spreadsheet_id, range_name):
 
         logger.info("Выполнение запроса к API Google Sheets")
         # Запускаем запрос и получаем ответ
-        response = await asyncio.to_thread(request.execute)
+        response = await execute(request)
 
         # Теперь response содержит фактический ответ
         logger.info("Данные успешно обновлены в Google Sheets",
@@ -65,3 +61,145 @@ async def write_sheet_data(df, spreadsheet_id, range_name):
                          error=str(e))
 
 
+# Строки, которые при USER_ENTERED стали бы числами или формулами
+_PARSED_TEXT_RE = re.compile(r'^\s*([=+]|-?\d+([.,]\d+)?\s*$)')
+
+
+def column_letter(index):
+    """Буква колонки по номеру с нуля: 0 -> A, 26 -> AA"""
+    letters = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(ord('A') + rest) + letters
+    return letters
+
+
+def column_index(letters):
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def split_range(range_name):
+    """'Лист!A3:H' -> ('Лист', номер первой колонки, первая строка)"""
+    sheet, _, cells = range_name.rpartition('!')
+    match = re.match(r'([A-Za-z]+)(\d*)', cells)
+    return sheet, column_index(match.group(1)), int(match.group(2) or 1)
+
+
+def sheet_rows(df):
+    """Строки DataFrame для записи: пустые значения заменяются на '' (в том числе в категориальных колонках)"""
+    values = df.to_numpy(dtype=object)
+    values[pd.isna(values)] = ''
+    return values.tolist()
+
+
+def changed_cells(old_rows, new_rows, width):
+    """
+    Изменённые ячейки в виде отрезков строк (номер строки, первая колонка, значения).
+    Строки, которых больше нет, очищаются.
+    """
+    runs = []
+    for row_index in range(max(len(old_rows), len(new_rows))):
+        old = old_rows[row_index] if row_index < len(old_rows) else []
+        new = new_rows[row_index] if row_index < len(new_rows) else [''] * width
+        start = None
+        for col in range(width + 1):
+            changed = col < width and (old[col] if col < len(old) else '') != (new[col] if col < len(new) else '')
+            if changed and start is None:
+                start = col
+            elif not changed and start is not None:
+                runs.append((row_index, start, new[start:col]))
+                start = None
+    return runs
+
+
+class SheetWriteBatch:
+    """
+    Пакетная запись диапазонов в одну таблицу.
+    Диапазон сравнивается со значениями, прочитанными из таблицы в этом же цикле, и в таблицу
+    уходят только изменённые ячейки; при изменении порядка строк диапазон перезаписывается целиком.
+    Все изменения цикла отправляются одним запросом values.batchUpdate.
+    """
+
+    def __init__(self, spreadsheet_id):
+        self.spreadsheet_id = spreadsheet_id
+        self.data = []
+        self.ranges = 0
+        self.cells = 0
+        self.full_rewrites = 0
+
+    def add(self, df, range_name, current=None):
+        """
+        Добавляет в пакет изменения диапазона относительно current - тех же строк, прочитанных
+        из таблицы в этом цикле (None - диапазон записывается целиком)
+        """
+        rows = sheet_rows(df)
+        keys = tuple(str(row[0]) for row in rows)
+        width = len(df.columns)
+        sheet, first_col, first_row = split_range(range_name)
+        old_rows = sheet_rows(current) if current is not None else None
+        old_keys = tuple(str(row[0]) for row in old_rows) if old_rows is not None else ()
+
+        common = min(len(keys), len(old_keys))
+        if old_rows is None or keys[:common] != old_keys[:common]:
+            # Порядок строк изменился или прочитанных значений нет: перезаписываем диапазон,
+            # лишние старые строки очищаем
+            old_count = len(old_rows) if old_rows is not None else 0
+            values = rows + [[''] * width for _ in range(old_count - len(rows))]
+            self.data.append({'range': range_name, 'values': values})
+            self.cells += len(values) * width
+            self.full_rewrites += 1
+        else:
+            for row_index, col, values in changed_cells(old_rows, rows, width):
+                row = first_row + row_index
+                cells = f"{column_letter(first_col + col)}{row}:{column_letter(first_col + col + len(values) - 1)}{row}"
+                self.data.append({'range': f"{sheet}!{cells}", 'values': [values]})
+                self.cells += len(values)
+
+        self.ranges += 1
+
+    def value_input_option(self):
+        """RAW, если ни одно текстовое значение не требует разбора таблицей"""
+        for entry in self.data:
+            for row in entry['values']:
+                if any(isinstance(value, str) and _PARSED_TEXT_RE.match(value) for value in row):
+                    return "USER_ENTERED"
+        return "RAW"
+
+    async def flush(self):
+        """Отправляет накопленные изменения одним запросом"""
+        if not self.data:
+            logger.info("Изменений для записи в Google Sheets нет", ranges=self.ranges)
+            self.ranges = 0
+            return
+
+        try:
+            service = await sheets_service()
+            body = {"valueInputOption": self.value_input_option(), "data": self.data}
+            request = service.spreadsheets().values().batchUpdate(spreadsheetId=self.spreadsheet_id, body=body)
+
+            logger.info("Выполнение пакетного запроса к API Google Sheets",
+                        ranges=self.ranges, updates=len(self.data), cells=self.cells,
+                        full_rewrites=self.full_rewrites, value_input_option=body["valueInputOption"])
+            response = await execute(request)
+
+            logger.info("Данные успешно обновлены в Google Sheets",
+                        updated_cells=response.get('totalUpdatedCells', 'Неизвестно'),
+                        updated_rows=response.get('totalUpdatedRows', 'Неизвестно'))
+        except HttpError as err:
+            logger.error("Произошла ошибка при пакетной записи данных в Google Sheets",
+                         spreadsheet_id=self.spreadsheet_id,
+                         status=err.resp.status,
+                         error=str(err))
+        except Exception as e:
+            logger.exception("Непредвиденная ошибка в SheetWriteBatch.flush",
+                             spreadsheet_id=self.spreadsheet_id,
+                             error=str(e))
+        finally:
+            self.data = []
+            self.ranges = 0
+            self.cells = 0
+            self.full_rewrites = 0
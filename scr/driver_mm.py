@@ -0,0 +1,116 @@
+import atexit
+import threading
+
+from selenium import webdriver
+from selenium.webdriver.firefox.service import Service
+from webdriver_manager.firefox import GeckoDriverManager
+
+from .config import GECKODRIVER_PATH, DRIVER_MAX_PAGES, DRIVER_MAX_RSS_MB
+from .logger import logger
+
+try:
+    import psutil
+except ImportError:  # без psutil память браузера не контролируется
+    psutil = None
+
+_geckodriver_path = None
+_geckodriver_lock = threading.Lock()
+
+_pool = []
+_pool_lock = threading.Lock()
+
+
+def resolve_geckodriver():
+    """Определяет путь к geckodriver один раз за процесс (или берёт GECKODRIVER_PATH)"""
+    global _geckodriver_path
+    with _geckodriver_lock:
+        if _geckodriver_path is None:
+            if GECKODRIVER_PATH:
+                _geckodriver_path = GECKODRIVER_PATH
+                logger.info(f"Используется geckodriver из GECKODRIVER_PATH: {_geckodriver_path}")
+            else:
+                _geckodriver_path = GeckoDriverManager().install()
+                logger.info(f"geckodriver установлен: {_geckodriver_path}")
+        return _geckodriver_path
+
+
+class DriverManager:
+    """
+    Долгоживущий браузер Firefox.
+    Переиспользуется между диапазонами и циклами и перезапускается
+    после max_pages страниц или при превышении max_rss_mb памяти.
+    """
+
+    def __init__(self, options_factory, max_pages=DRIVER_MAX_PAGES, max_rss_mb=DRIVER_MAX_RSS_MB, name="driver"):
+        self.options_factory = options_factory
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.logger = logger.bind(driver=name)
+        self.lock = threading.Lock()
+        self.driver = None
+        self.pages = 0
+
+    def get(self):
+        """Возвращает рабочий браузер, при необходимости запуская или перезапуская его"""
+        if self.driver is not None and self.should_recycle():
+            self.recycle()
+        if self.driver is None:
+            self.logger.info("Запуск браузера")
+            service = Service(resolve_geckodriver())
+            self.driver = webdriver.Firefox(service=service, options=self.options_factory())
+            self.pages = 0
+            self.logger.info("Браузер запущен")
+        return self.driver
+
+    def page_done(self):
+        self.pages += 1
+
+    def rss_mb(self):
+        """Суммарная память процесса Firefox и его дочерних процессов в МБ"""
+        if psutil is None or self.driver is None:
+            return None
+        pid = self.driver.capabilities.get('moz:processID')
+        if not pid:
+            return None
+        try:
+            process = psutil.Process(pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / 1024 / 1024
+        except psutil.Error:
+            return None
+
+    def should_recycle(self):
+        if self.max_pages and self.pages >= self.max_pages:
+            self.logger.info(f"Перезапуск браузера после {self.pages} страниц")
+            return True
+        if self.max_rss_mb:
+            rss = self.rss_mb()
+            if rss is not None and rss >= self.max_rss_mb:
+                self.logger.info(f"Перезапуск браузера: память {rss:.0f} МБ")
+                return True
+        return False
+
+    def recycle(self):
+        """Закрывает браузер; следующий вызов get() запустит новый"""
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                self.logger.warning(f"Ошибка при закрытии браузера: {e}")
+        self.driver = None
+        self.pages = 0
+
+
+def get_driver_pool(size, options_factory):
+    """Возвращает size долгоживущих браузеров, общих для всех диапазонов процесса"""
+    with _pool_lock:
+        while len(_pool) < size:
+            _pool.append(DriverManager(options_factory, name=f"browser-{len(_pool)}"))
+        return _pool[:size]
+
+
+@atexit.register
+def shutdown_driver_pool():
+    with _pool_lock:
+        for manager in _pool:
+            manager.recycle()
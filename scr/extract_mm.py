@@ -0,0 +1,124 @@
+import re
+from functools import lru_cache
+
+from bs4 import BeautifulSoup
+
+from .logger import logger
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    # Бэкенд Modest (selectolax.parser) с selectolax 1.0 не поддерживается, используется Lexbor
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+OFFER_CLASS = 'product-offer'
+SELLER_CLASS = 'pdp-merchant-rating-block__merchant-name'
+PRICE_CLASS = 'product-offer-price__amount'
+
+# Открывающий тег div с классом product-offer (но не product-offer-price и т.п.)
+OFFER_DIV_RE = re.compile(r'<div\b[^>]*\bclass=["\'](?:[^"\']*\s)?' + OFFER_CLASS + r'(?=[\s"\'])', re.IGNORECASE)
+DIV_TAG_RE = re.compile(r'<(/?)div\b', re.IGNORECASE)
+
+
+def offers_block(html):
+    """
+    Вырезает из страницы фрагмент от первого до конца последнего div.product-offer.
+    Если предложения не найдены, возвращает страницу целиком.
+    """
+    first = OFFER_DIV_RE.search(html)
+    if not first:
+        return html
+
+    last_start = first.start()
+    for match in OFFER_DIV_RE.finditer(html, first.end()):
+        last_start = match.start()
+
+    # Ищем закрывающий тег последнего предложения по глубине вложенности div
+    depth = 0
+    for tag in DIV_TAG_RE.finditer(html, last_start):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            end = html.find('>', tag.end())
+            return html[first.start():end + 1 if end != -1 else len(html)]
+
+    return html[first.start():]
+
+
+def parse_offers_bs4(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    offers = []
+    for offer in soup.find_all('div', class_=OFFER_CLASS):
+        seller_name = offer.find('span', class_=SELLER_CLASS)
+        current_price = offer.find('span', class_=PRICE_CLASS)
+        offers.append((seller_name.text if seller_name else "N/A",
+                       current_price.text.strip() if current_price else "N/A"))
+    return offers
+
+
+def _class_xpath(tag, class_name):
+    return f"{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+OFFER_XPATH = '//' + _class_xpath('div', OFFER_CLASS)
+SELLER_XPATH = './/' + _class_xpath('span', SELLER_CLASS)
+PRICE_XPATH = './/' + _class_xpath('span', PRICE_CLASS)
+
+
+def parse_offers_lxml(html):
+    tree = lxml.html.fromstring(html)
+    offers = []
+    for offer in tree.xpath(OFFER_XPATH):
+        seller_name = offer.xpath(SELLER_XPATH)
+        current_price = offer.xpath(PRICE_XPATH)
+        offers.append((seller_name[0].text_content() if seller_name else "N/A",
+                       current_price[0].text_content().strip() if current_price else "N/A"))
+    return offers
+
+
+def parse_offers_selectolax(html):
+    tree = LexborHTMLParser(html)
+    offers = []
+    for offer in tree.css(f'div.{OFFER_CLASS}'):
+        seller_name = offer.css_first(f'span.{SELLER_CLASS}')
+        current_price = offer.css_first(f'span.{PRICE_CLASS}')
+        offers.append((seller_name.text() if seller_name else "N/A",
+                       current_price.text().strip() if current_price else "N/A"))
+    return offers
+
+
+EXTRACTORS = {
+    'bs4': parse_offers_bs4,
+    'lxml': parse_offers_lxml,
+    'selectolax': parse_offers_selectolax,
+}
+
+_AVAILABLE = {
+    'bs4': True,
+    'lxml': lxml is not None,
+    'selectolax': LexborHTMLParser is not None,
+}
+
+
+@lru_cache(maxsize=None)
+def get_extractor(backend):
+    """Возвращает функцию разбора предложений; при отсутствии библиотеки - bs4"""
+    if backend not in EXTRACTORS:
+        raise ValueError(f"Неизвестный парсер предложений: {backend}")
+    if not _AVAILABLE[backend]:
+        logger.warning(f"Парсер {backend} не установлен, используется bs4")
+        return parse_offers_bs4
+    return EXTRACTORS[backend]
+
+
+def extract_offers(html, backend='bs4', offers_only=True):
+    """Возвращает список (продавец, текст цены) для каждого div.product-offer страницы"""
+    if offers_only:
+        html = offers_block(html)
+    if not html or not html.strip():
+        return []
+    return get_extractor(backend)(html)
@@ -0,0 +1,70 @@
+from collections import Counter
+from urllib.parse import urlsplit
+
+from .logger import logger
+from .parser_mm import iter_scraped_offers
+
+
+def card_key(url):
+    """Ключ карточки товара: хост, путь и фрагмент ссылки без параметров запроса"""
+    parts = urlsplit(str(url).strip())
+    key = f"{parts.netloc.lower()}{parts.path.rstrip('/')}"
+    return f"{key}#{parts.fragment}" if parts.fragment else key
+
+
+class CycleFetchPlanner:
+    """
+    План загрузки страниц на цикл обновления.
+    Собирает ссылки всех кабинетов заранее, загружает каждую карточку товара
+    один раз и раздаёт разобранные предложения всем кабинетам, которые на неё ссылаются.
+    """
+
+    def __init__(self):
+        self.references = Counter()
+        self.cabinets = {}
+        self.offers = {}
+        self.fetched = 0
+        self.reused = 0
+
+    def register(self, range_name, df):
+        """Добавляет ссылки диапазона в план цикла"""
+        keys = [card_key(link) for link in df['link'] if str(link).strip()]
+        self.cabinets[range_name] = len(keys)
+        self.references.update(keys)
+
+    def log_plan(self, log=logger):
+        references = sum(self.references.values())
+        log.info(f"План загрузки цикла: ссылок {references}, уникальных карточек {len(self.references)}, "
+                 f"можно сэкономить загрузок: {references - len(self.references)}",
+                 cabinets=self.cabinets)
+
+    def iter_offers(self, url_dict, log=logger, run_id=None):
+        """
+        Отдаёт (ключ товара, предложения) для ссылок диапазона.
+        Карточки, уже загруженные в этом цикле другим кабинетом, повторно не загружаются.
+        run_id - запуск для журнала загрузки (см. iter_scraped_offers).
+        """
+        by_card = {}
+        for key, url in url_dict.items():
+            by_card.setdefault(card_key(url), []).append(key)
+
+        to_fetch = {card: url_dict[keys[0]] for card, keys in by_card.items() if card not in self.offers}
+        reused = {card: keys for card, keys in by_card.items() if card in self.offers}
+        if reused:
+            log.info(f"Карточек, уже загруженных в этом цикле: {len(reused)}")
+
+        for card, keys in reused.items():
+            self.reused += len(keys)
+            for key in keys:
+                yield key, self.offers[card]
+
+        for card, offers in iter_scraped_offers(to_fetch, log, run_id):
+            self.offers[card] = offers
+            self.fetched += 1
+            self.reused += len(by_card[card]) - 1
+            for key in by_card[card]:
+                yield key, offers
+
+    def report(self, log=logger):
+        """Логирует, сколько загрузок страниц сэкономлено за цикл"""
+        log.info(f"Загружено карточек за цикл: {self.fetched}, сэкономлено загрузок страниц: {self.reused}")
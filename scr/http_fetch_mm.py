@@ -0,0 +1,173 @@
+import asyncio
+import re
+import threading
+
+import aiohttp
+
+from .config import HTTP_CONCURRENCY, HTTP_TIMEOUT
+from .logger import logger
+from .rate_limit import scrape_limiter, host_of
+from .stream_mm import PageStream
+
+# Маркеры страницы товара: блок предложений или сообщение об отсутствии товара
+PRODUCT_MARKERS_RE = re.compile(r'class="[^"]*\b(?:product-offer|product-not-found)(?![-\w])')
+
+# Признаки страницы проверки на бота
+BOT_CHECK_RE = re.compile(r'captcha|qrator|challenge-form|Access denied|Доступ ограничен|Проверка браузера',
+                          re.IGNORECASE)
+
+
+def classify_page(html):
+    """Возвращает 'ok', 'bot_check' или 'no_markers' для HTML страницы товара"""
+    if PRODUCT_MARKERS_RE.search(html):
+        return 'ok'
+    if BOT_CHECK_RE.search(html):
+        return 'bot_check'
+    return 'no_markers'
+
+
+class FetchStats:
+    """Счётчики загрузки страниц по HTTP и через браузер"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.http_hits = 0
+        self.http_misses = {'bot_check': 0, 'no_markers': 0, 'throttled': 0, 'timeout': 0, 'status': 0, 'error': 0}
+        self.browser_pages = 0
+        self.browser_seconds = 0.0
+        self.page_loads = 0
+        self.page_load_seconds = 0.0
+        self.page_load_bytes = 0
+
+    def add_http(self, outcome):
+        with self.lock:
+            if outcome == 'ok':
+                self.http_hits += 1
+            else:
+                self.http_misses[outcome] += 1
+
+    def add_browser(self, pages, seconds):
+        with self.lock:
+            self.browser_pages += pages
+            self.browser_seconds += seconds
+
+    def add_page_load(self, seconds, transferred):
+        """Время загрузки страницы в браузере до появления блока предложений и переданные байты"""
+        with self.lock:
+            self.page_loads += 1
+            self.page_load_seconds += seconds
+            self.page_load_bytes += transferred
+
+    def report(self, log=logger):
+        """Логирует долю страниц по каждому пути и сэкономленное время браузера"""
+        with self.lock:
+            http_total = self.http_hits + sum(self.http_misses.values())
+            total = self.http_hits + self.browser_pages
+            if not total:
+                return
+            avg_browser_page = self.browser_seconds / self.browser_pages if self.browser_pages else 0
+            page_loads = max(self.page_loads, 1)
+            log.info("Статистика загрузки страниц",
+                     pages=total,
+                     http_hit_rate=f"{self.http_hits / total:.1%}",
+                     browser_rate=f"{self.browser_pages / total:.1%}",
+                     http_attempts=http_total,
+                     http_misses=dict(self.http_misses),
+                     browser_seconds=round(self.browser_seconds, 1),
+                     browser_seconds_saved=round(self.http_hits * avg_browser_page, 1),
+                     avg_page_load_seconds=round(self.page_load_seconds / page_loads, 2),
+                     avg_page_kb=round(self.page_load_bytes / page_loads / 1024, 1),
+                     rate_per_minute=scrape_limiter.rates())
+
+
+# Накопительная статистика за цикл обновления
+fetch_stats = FetchStats()
+
+
+def status_outcome(status):
+    """
+    Исход ответа с кодом, отличным от 200: 'throttled' для 403, 429 и 5xx (хост ограничивает запросы),
+    'status' для остальных (например, 404 у снятого с продажи товара)
+    """
+    return 'throttled' if status in (403, 429) or status >= 500 else 'status'
+
+
+# Исходы, при которых частота запросов к хосту снижается; остальные неудачи только отправляют страницу в браузер
+BACKOFF_OUTCOMES = ('bot_check', 'throttled', 'timeout')
+
+
+async def fetch_page(session, semaphore, key, url, headers, stream, fallback, log):
+    host = host_of(url)
+    async with semaphore:
+        await scrape_limiter.acquire_async(host)
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status != 200:
+                    html, outcome = None, status_outcome(response.status)
+                else:
+                    html = await response.text()
+                    outcome = classify_page(html)
+        except asyncio.TimeoutError:
+            html, outcome = None, 'timeout'
+        except aiohttp.ClientError:
+            html, outcome = None, 'error'
+
+        fetch_stats.add_http(outcome)
+        if outcome in BACKOFF_OUTCOMES:
+            scrape_limiter.failure(host, outcome)
+        elif outcome in ('ok', 'no_markers'):
+            scrape_limiter.success(host)
+
+        if outcome == 'ok':
+            # Страница передаётся на разбор, пока занят слот семафора - так в памяти их не больше concurrency
+            await asyncio.to_thread(stream.emit, key, html)
+        else:
+            log.debug(f"HTTP-загрузка не подошла ({outcome}): {url}")
+            fallback[key] = url
+
+
+async def stream_pages_http(url_dict, user_agent, stream, fallback, log=logger,
+                            concurrency=HTTP_CONCURRENCY, timeout=HTTP_TIMEOUT):
+    """
+    Загружает страницы товаров обычными HTTP-запросами с пулом соединений.
+    Страницы с маркерами товара передаются в stream, остальные ссылки попадают в fallback.
+    """
+    headers = {
+        "User-Agent": user_agent,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
+    }
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        await asyncio.gather(*[fetch_page(session, semaphore, key, url, headers, stream, fallback, log)
+                               for key, url in url_dict.items()])
+
+
+def iter_pages_http(url_dict, user_agent, fallback, log=logger):
+    """
+    Отдаёт (ключ, HTML) по мере HTTP-загрузки.
+    Ссылки, которые нужно загрузить через браузер, добавляются в fallback.
+    """
+    stream = PageStream()
+
+    def run():
+        try:
+            asyncio.run(stream_pages_http(url_dict, user_agent, stream, fallback, log))
+        except Exception as e:
+            log.error(f"Ошибка HTTP-загрузки, страницы загружаются через браузер: {e}")
+        # Всё, что не дошло до разбора, загружается через браузер
+        for key, url in url_dict.items():
+            if key not in stream.sent:
+                fallback.setdefault(key, url)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    yield from stream.drain(lambda: not thread.is_alive())
+
+    log.info(f"HTTP-загрузка: получено {len(stream.sent)} из {len(url_dict)} страниц, через браузер: {len(fallback)}")
@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import time
+
+from .config import JOB_QUEUE_DB, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+from .logger import logger
+
+
+class JobQueue:
+    """
+    Надёжная очередь заданий в SQLite для координатора и воркеров (на одном хосте или на
+    нескольких с общим файлом базы). Воркер забирает задание с арендой на lease_seconds
+    и продлевает её, пока работает; задание с истёкшей арендой (воркер упал) снова
+    становится доступным, пока не исчерпано max_attempts попыток.
+    База работает с обычным журналом отката, а не WAL: WAL требует общей памяти процессов
+    одного хоста и небезопасен для файла на сетевом диске. Захват заданий выполняется
+    в транзакциях BEGIN IMMEDIATE под блокировкой файла.
+    """
+
+    def __init__(self, db_name=JOB_QUEUE_DB, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.db_name = db_name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self.connect() as conn:
+            conn.executescript("""
+                PRAGMA journal_mode = DELETE;
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, job_key TEXT, payload TEXT,
+                    status TEXT DEFAULT 'pending', worker TEXT, lease_until REAL, attempts INTEGER DEFAULT 0,
+                    created_at REAL, finished_at REAL, result TEXT, error TEXT);
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until);
+                CREATE INDEX IF NOT EXISTS jobs_key ON jobs (job_key, status);
+            """)
+
+    def connect(self):
+        return sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+
+    def enqueue(self, kind, job_key, payload):
+        """Добавляет задание и возвращает его id; если по job_key уже есть незавершённое задание - его id"""
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            active = conn.execute("SELECT id FROM jobs WHERE job_key = ? AND status IN ('pending', 'running')",
+                                  (job_key,)).fetchone()
+            if active:
+                conn.execute("COMMIT")
+                return active[0]
+            job_id = conn.execute("INSERT INTO jobs (kind, job_key, payload, created_at) VALUES (?, ?, ?, ?)",
+                                  (kind, job_key, json.dumps(payload, ensure_ascii=False), time.time())).lastrowid
+            conn.execute("COMMIT")
+        return job_id
+
+    def claim(self, worker):
+        """
+        Забирает самое старое доступное задание: ожидающее или с истёкшей арендой.
+        Возвращает (id, kind, payload) или None.
+        """
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Задания упавших воркеров, исчерпавшие попытки, помечаются неудачными
+            conn.execute("UPDATE jobs SET status = 'failed', error = 'аренда истекла', finished_at = ? "
+                         "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                         (now, now, self.max_attempts))
+            row = conn.execute("SELECT id, kind, payload, status, worker FROM jobs "
+                               "WHERE status = 'pending' OR (status = 'running' AND lease_until < ?) "
+                               "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            job_id, kind, payload, status, previous_worker = row
+            conn.execute("UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                         "WHERE id = ?", (worker, now + self.lease_seconds, job_id))
+            conn.execute("COMMIT")
+        if status == 'running':
+            logger.warning(f"Задание {job_id} воркера {previous_worker} возвращено в работу: аренда истекла")
+        return job_id, kind, json.loads(payload)
+
+    def heartbeat(self, job_id, worker):
+        """Продлевает аренду; False, если задание уже забрал другой воркер"""
+        with self.connect() as conn:
+            updated = conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                                   (time.time() + self.lease_seconds, job_id, worker)).rowcount
+        return bool(updated)
+
+    def complete(self, job_id, worker, result=None):
+        with self.connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'done', result = ?, finished_at = ? "
+                         "WHERE id = ? AND worker = ? AND status = 'running'",
+                         (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker))
+
+    def fail(self, job_id, worker, error):
+        """Ошибка задания: возвращает его в очередь, пока не исчерпаны попытки"""
+        with self.connect() as conn:
+            conn.execute("UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                         "error = ?, finished_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                         (self.max_attempts, str(error), time.time(), job_id, worker))
+
+    def finished(self, job_ids):
+        """{id: (status, результат)} для завершённых заданий из job_ids"""
+        if not job_ids:
+            return {}
+        with self.connect() as conn:
+            rows = conn.execute(f"SELECT id, status, result FROM jobs WHERE status IN ('done', 'failed') "
+                                f"AND id IN ({','.join('?' * len(job_ids))})", list(job_ids)).fetchall()
+        return {job_id: (status, json.loads(result) if result else None) for job_id, status, result in rows}
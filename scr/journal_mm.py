@@ -0,0 +1,82 @@
+import json
+import sqlite3
+import time
+
+from .config import SQLITE_DB_NAME, SCRAPE_JOURNAL_RESUME_MINUTES, SCRAPE_JOURNAL_BATCH, SCRAPE_JOURNAL_FLUSH_SECONDS
+from .logger import logger
+
+
+class ScrapeJournal:
+    """
+    Журнал загрузки страниц товаров одного запуска (run_id - например, название диапазона):
+    результат разбора каждой ссылки записывается по мере обработки.
+    Если запуск прервался, следующий запуск с тем же run_id берёт из журнала уже разобранные
+    ссылки моложе resume_minutes и загружает только остальные. После завершения загрузки
+    записи запуска удаляются (finish), поэтому журнал не служит кэшем для следующих циклов.
+    Записи копятся в памяти и сохраняются пачками по batch_size или раз в flush_seconds.
+    """
+
+    def __init__(self, run_id, db_name=SQLITE_DB_NAME, resume_minutes=SCRAPE_JOURNAL_RESUME_MINUTES,
+                 batch_size=SCRAPE_JOURNAL_BATCH, flush_seconds=SCRAPE_JOURNAL_FLUSH_SECONDS):
+        self.run_id = str(run_id)
+        self.db_name = db_name
+        self.resume_seconds = resume_minutes * 60
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.pending = []
+        self.flushed_at = time.monotonic()
+        with sqlite3.connect(self.db_name) as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(scrape_journal)")]
+            if columns and 'run_id' not in columns:
+                # Журнал без привязки к запуску не годится для продолжения: его записи не переносятся
+                conn.execute("DROP TABLE scrape_journal")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scrape_journal (
+                    run_id TEXT, url TEXT, status TEXT, offers TEXT, updated_at REAL, PRIMARY KEY (run_id, url))
+            """)
+            conn.execute("DELETE FROM scrape_journal WHERE updated_at < ?", (time.time() - self.resume_seconds,))
+
+    def completed(self, urls):
+        """{ссылка: предложения} для ссылок, успешно разобранных прерванным запуском не раньше resume_minutes назад"""
+        if self.resume_seconds <= 0:
+            return {}
+        urls = list(set(urls))
+        since = time.time() - self.resume_seconds
+        done = {}
+        with sqlite3.connect(self.db_name) as conn:
+            # Параметры передаются частями, чтобы не упереться в лимит переменных SQLite
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT url, offers FROM scrape_journal WHERE run_id = ? AND status = 'done' "
+                    f"AND updated_at >= ? AND url IN ({','.join('?' * len(chunk))})", (self.run_id, since, *chunk))
+                done.update((url, [tuple(offer) for offer in json.loads(offers)]) for url, offers in rows)
+        return done
+
+    def record(self, url, offers):
+        """Отмечает результат разбора ссылки; пустой результат не считается завершённым"""
+        status = 'done' if offers else 'empty'
+        self.pending.append((self.run_id, url, status, json.dumps(offers, ensure_ascii=False), time.time()))
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.flushed_at >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Сохраняет накопленные записи одной транзакцией"""
+        self.flushed_at = time.monotonic()
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                conn.executemany("INSERT OR REPLACE INTO scrape_journal VALUES (?, ?, ?, ?, ?)", pending)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи журнала загрузки: {e}")
+
+    def finish(self):
+        """Загрузка запуска завершена: его записи больше не нужны для продолжения"""
+        self.pending = []
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                conn.execute("DELETE FROM scrape_journal WHERE run_id = ?", (self.run_id,))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка очистки журнала загрузки: {e}")
@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .config import PAGE_CACHE_DIR, PAGE_CACHE_TTL_MINUTES, PAGE_CACHE_MAX_MB, PAGE_CACHE_KEEP_DAYS
+from .logger import logger
+
+
+def content_hash(html):
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    Сжатый кэш HTML страниц товаров с адресацией по содержимому.
+    Страницы хранятся в objects/<hash[:2]>/<hash>.html.gz, индекс загрузок
+    (ссылка, время, хэш) и разобранные предложения - в index.db.
+    """
+
+    def __init__(self, directory=PAGE_CACHE_DIR, ttl_minutes=PAGE_CACHE_TTL_MINUTES,
+                 max_mb=PAGE_CACHE_MAX_MB, keep_days=PAGE_CACHE_KEEP_DAYS):
+        self.directory = directory
+        self.ttl = ttl_minutes * 60
+        self.max_bytes = max_mb * 1024 * 1024
+        self.keep_seconds = keep_days * 24 * 3600
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fetches (url TEXT, fetched_at REAL, hash TEXT);
+            CREATE INDEX IF NOT EXISTS fetches_url ON fetches (url, fetched_at);
+            CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, size INTEGER, last_used REAL);
+            CREATE TABLE IF NOT EXISTS parsed (hash TEXT PRIMARY KEY, offers TEXT);
+        """)
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], f"{digest}.html.gz")
+
+    def get_fresh(self, url):
+        """Возвращает (HTML, хэш) последней загрузки ссылки, если она моложе TTL, иначе None"""
+        if self.ttl <= 0:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hash FROM fetches WHERE url = ? AND fetched_at >= ? ORDER BY fetched_at DESC LIMIT 1",
+                (url, time.time() - self.ttl)).fetchone()
+            if not row:
+                return None
+            try:
+                with gzip.open(self.blob_path(row[0]), 'rt', encoding='utf-8') as f:
+                    html = f.read()
+            except OSError:
+                return None
+            self.conn.execute("UPDATE blobs SET last_used = ? WHERE hash = ?", (time.time(), row[0]))
+            self.conn.commit()
+            return html, row[0]
+
+    def put(self, url, html):
+        """Сохраняет загруженную страницу и возвращает хэш её содержимого"""
+        digest = content_hash(html)
+        path = self.blob_path(digest)
+        now = time.time()
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with gzip.open(path + '.tmp', 'wt', encoding='utf-8', compresslevel=6) as f:
+                    f.write(html)
+                os.replace(path + '.tmp', path)
+            self.conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (digest, os.path.getsize(path), now))
+            self.conn.execute("INSERT INTO fetches VALUES (?, ?, ?)", (url, now, digest))
+            self.conn.commit()
+        return digest
+
+    def get_parsed(self, digest):
+        """Предложения, ранее разобранные из страницы с таким же содержимым"""
+        with self.lock:
+            row = self.conn.execute("SELECT offers FROM parsed WHERE hash = ?", (digest,)).fetchone()
+        return [tuple(offer) for offer in json.loads(row[0])] if row else None
+
+    def put_parsed(self, digest, offers):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO parsed VALUES (?, ?)",
+                              (digest, json.dumps(offers, ensure_ascii=False)))
+            self.conn.commit()
+
+    def evict(self):
+        """Удаляет загрузки старше keep_days и самые давно использованные страницы сверх max_mb"""
+        with self.lock:
+            self.conn.execute("DELETE FROM fetches WHERE fetched_at < ?", (time.time() - self.keep_seconds,))
+            orphans = [row[0] for row in self.conn.execute(
+                "SELECT hash FROM blobs WHERE hash NOT IN (SELECT hash FROM fetches)")]
+
+            live = "SELECT hash FROM fetches"
+            total = self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM blobs WHERE hash IN ({live})").fetchone()[0]
+            overflow = []
+            if total > self.max_bytes:
+                for digest, size in self.conn.execute(
+                        f"SELECT hash, size FROM blobs WHERE hash IN ({live}) ORDER BY last_used").fetchall():
+                    overflow.append(digest)
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+
+            removed = orphans + overflow
+            for digest in removed:
+                try:
+                    os.remove(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+            self.conn.executemany("DELETE FROM blobs WHERE hash = ?", [(d,) for d in removed])
+            self.conn.executemany("DELETE FROM fetches WHERE hash = ?", [(d,) for d in overflow])
+            self.conn.executemany("DELETE FROM parsed WHERE hash = ?", [(d,) for d in removed])
+            self.conn.commit()
+
+        if removed:
+            logger.info(f"Из кэша страниц удалено: {len(removed)}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """Общий для процесса кэш страниц"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache()
+        return _cache
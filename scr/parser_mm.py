@@ -1,23 +1,39 @@
-from selenium import webdriver
 from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException, WebDriverException
-from webdriver_manager.firefox import GeckoDriverManager
-from bs4 import BeautifulSoup
 import pandas as pd
 import numpy as np
 import time
+import queue
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from .config import (
+    PARSER_WORKERS, PARSE_PROCESSES, FETCH_MODE, SCROLL_PAUSE_SECONDS, EXTRACTOR_BACKEND, EXTRACTOR_OFFERS_ONLY,
+    PAGE_CACHE_ENABLED, LEAN_BROWSING, PAGE_LOAD_STRATEGY, BLOCKED_HOSTS, SCRAPE_JOURNAL_ENABLED
+)
+from .driver_mm import get_driver_pool
+from .extract_mm import extract_offers, offers_block
+from .http_fetch_mm import iter_pages_http, fetch_stats, classify_page
+from .journal_mm import ScrapeJournal
 from .logger import logger
-import re
+from .page_cache_mm import get_page_cache
+from .rate_limit import scrape_limiter, host_of
+from .sku_state_mm import SkuStateStore, prioritize
+from .stream_mm import PageStream
 import random
+from urllib.parse import quote
 
 
 
 my_markets = ['ByMarket','Tech PC Components','SSmart shop','E-Shopper']
 
+RESULT_COLUMNS = ['seller_id', 'name', 'mp_on_market', 'market_with_mp']
+
 loger = logger
 
 def get_random_user_agent():
@@ -31,12 +47,49 @@ def get_random_user_agent():
 def add_random_actions(driver):
     # Прокрутка страницы
     driver.execute_script("window.scrollTo(0, document.body.scrollHeight / 2);")
-    time.sleep(random.uniform(1, 3))
+    time.sleep(random.uniform(*SCROLL_PAUSE_SECONDS))
     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-    time.sleep(random.uniform(1, 3))
+    time.sleep(random.uniform(*SCROLL_PAUSE_SECONDS))
     driver.execute_script("window.scrollTo(0, 0);")
 
-def get_product_offers(url_dict, logger):
+# Суммарный объём переданных данных по Resource Timing API.
+# Для сторонних ресурсов без Timing-Allow-Origin браузер отдаёт 0, поэтому это оценка снизу.
+TRANSFERRED_BYTES_JS = """
+const nav = performance.getEntriesByType('navigation')[0];
+let total = nav ? nav.transferSize : 0;
+for (const entry of performance.getEntriesByType('resource')) total += entry.transferSize || 0;
+return total;
+"""
+
+
+def blocked_hosts_pac(hosts):
+    """PAC-скрипт, отправляющий запросы к hosts на несуществующий прокси"""
+    conditions = " || ".join(f'host == "{host}" || dnsDomainIs(host, ".{host}")' for host in hosts)
+    script = (f'function FindProxyForURL(url, host) {{ if ({conditions}) return "PROXY 127.0.0.1:9"; '
+              f'return "DIRECT"; }}')
+    return "data:text/javascript," + quote(script)
+
+
+def set_lean_preferences(options):
+    """Облегчённый профиль: без картинок, шрифтов, видео, трекеров и рекламных хостов"""
+    options.set_preference("permissions.default.image", 2)
+    options.set_preference("browser.display.use_document_fonts", 0)
+    options.set_preference("gfx.downloadable_fonts.enabled", False)
+    options.set_preference("media.autoplay.default", 5)
+    options.set_preference("media.autoplay.blocking_policy", 2)
+    options.set_preference("media.mediasource.enabled", False)
+    options.set_preference("privacy.trackingprotection.enabled", True)
+    options.set_preference("privacy.trackingprotection.socialtracking.enabled", True)
+    options.set_preference("browser.contentblocking.category", "strict")
+    options.set_preference("network.prefetch-next", False)
+    options.set_preference("network.dns.disablePrefetch", True)
+    options.set_preference("network.http.speculative-parallel-limit", 0)
+    if BLOCKED_HOSTS:
+        options.set_preference("network.proxy.type", 2)
+        options.set_preference("network.proxy.autoconfig_url", blocked_hosts_pac(BLOCKED_HOSTS))
+
+
+def create_options():
     options = Options()
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
@@ -44,185 +97,444 @@ def get_product_offers(url_dict, logger):
     options.add_argument("--disable-extensions")
     options.add_argument("--headless")
     options.add_argument(f"user-agent={get_random_user_agent()}")
+    if LEAN_BROWSING:
+        set_lean_preferences(options)
+        options.page_load_strategy = PAGE_LOAD_STRATEGY
+    return options
 
-    logger.info("Инициализация драйвера")
-    try:
-        service = Service(GeckoDriverManager().install())
-        driver = webdriver.Firefox(service=service, options=options)
-        logger.info("Драйвер успешно инициализирован")
-    except Exception as e:
-        logger.error(f"Ошибка при инициализации драйвера: {e}")
-        return None
 
-    all_html_content = {}
+def load_page(driver, url, logger):
+    """Загружает страницу товара и возвращает (HTML, истекло ли время ожидания)"""
+    logger.info(f"Попытка загрузки страницы: {url}")
+    started = time.monotonic()
+    driver.get(url)
+    logger.debug("Команда загрузки страницы выполнена")
 
-    try:
-        for key, url in url_dict.items():
-            logger.info(f"Попытка загрузки страницы: {url}")
-            driver.get(url)
-            logger.debug("Команда загрузки страницы выполнена")
-
-            # Добавление случайных действий
-            add_random_actions(driver)
-
-            wait = WebDriverWait(driver, 60)
-            wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            logger.debug("Элемент <body> загружен")
-
-            try:
-                wait.until(lambda driver: driver.execute_script("return document.readyState") == "complete")
-                logger.debug("Страница полностью загружена")
+    wait = WebDriverWait(driver, 60)
+    wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+    logger.debug("Элемент <body> загружен")
 
-                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ".product-offer, .product-not-found")))
+    # Добавление случайных действий (их паузы не входят во время загрузки)
+    actions_started = time.monotonic()
+    add_random_actions(driver)
+    actions_seconds = time.monotonic() - actions_started
 
-                product_offer_exists = driver.execute_script("return document.querySelector('.product-offer') !== null")
-                if product_offer_exists:
-                    logger.info("Элемент product-offer найден")
-                else:
-                    logger.warning("Элемент product-offer не найден")
+    timed_out = False
+    try:
+        # При стратегии eager/none не ждём загрузки картинок и скриптов - достаточно блока предложений
+        if driver.capabilities.get('pageLoadStrategy', 'normal') == 'normal':
+            wait.until(lambda driver: driver.execute_script("return document.readyState") == "complete")
+            logger.debug("Страница полностью загружена")
 
-            except TimeoutException:
-                logger.warning("Превышено время ожидания загрузки страницы")
+        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ".product-offer, .product-not-found")))
 
-            html_content = driver.page_source
-            logger.debug("HTML страницы получен")
-            all_html_content[key] = html_content
+        product_offer_exists = driver.execute_script("return document.querySelector('.product-offer') !== null")
+        if product_offer_exists:
+            logger.info("Элемент product-offer найден")
+        else:
+            logger.warning("Элемент product-offer не найден")
 
-            # Случайная задержка между запросами
-            time.sleep(random.uniform(5, 10))
+    except TimeoutException:
+        logger.warning("Превышено время ожидания загрузки страницы")
+        timed_out = True
 
-    except WebDriverException as e:
-        logger.error(f"Ошибка WebDriver: {e}")
-    except Exception as e:
-        logger.error(f"Произошла неожиданная ошибка: {e}")
-    finally:
-        logger.info("Закрытие браузера")
-        driver.quit()
+    load_seconds = time.monotonic() - started - actions_seconds
+    try:
+        transferred = driver.execute_script(TRANSFERRED_BYTES_JS) or 0
+    except WebDriverException:
+        transferred = 0
+    fetch_stats.add_page_load(load_seconds, transferred)
+    logger.debug(f"Страница загружена за {load_seconds:.1f} с, передано {transferred / 1024:.0f} КБ")
+
+    html_content = driver.page_source
+    logger.debug("HTML страницы получен")
+    return html_content, timed_out
+
+
+def offers_worker(worker_id, manager, url_queue, stream, logger, incomplete=None):
+    """
+    Браузер пула: забирает ссылки из общей очереди, пока она не опустеет.
+    Ключи страниц, загрузка которых не дождалась блока предложений, добавляются в incomplete.
+    """
+    worker_logger = logger.bind(worker=worker_id)
+
+    with manager.lock:
+        while not stream.stopped.is_set():
+            try:
+                key, url = url_queue.get_nowait()
+            except queue.Empty:
+                break
 
-    return all_html_content
+            try:
+                driver = manager.get()
+            except Exception as e:
+                worker_logger.error(f"Ошибка при инициализации драйвера: {e}")
+                url_queue.put((key, url))
+                return
 
+            # Темп запросов к хосту задаёт общий для всех браузеров планировщик
+            host = host_of(url)
+            scrape_limiter.acquire(host)
 
-def extract_data(html_content, logger):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    offers = soup.find_all('div', class_='product-offer')
+            started = time.monotonic()
+            try:
+                html_content, timed_out = load_page(driver, url, worker_logger)
+                manager.page_done()
+                fetch_stats.add_browser(1, time.monotonic() - started)
 
+                outcome = 'timeout' if timed_out else classify_page(html_content)
+                if outcome in ('timeout', 'bot_check'):
+                    scrape_limiter.failure(host, outcome)
+                else:
+                    scrape_limiter.success(host)
+                if timed_out and incomplete is not None:
+                    incomplete.add(key)
+
+                if not stream.emit(key, html_content):
+                    break
+            except WebDriverException as e:
+                # Сбой браузера не говорит об ограничении со стороны хоста: частота запросов не снижается
+                worker_logger.error(f"Ошибка WebDriver: {e}")
+                manager.recycle()
+            except Exception as e:
+                worker_logger.error(f"Произошла неожиданная ошибка: {e}")
+
+
+def iter_product_offers_browser(url_dict, logger, workers=None, incomplete=None):
+    """
+    Загружает страницы товаров пулом из нескольких браузеров и отдаёт (ключ, HTML) по мере загрузки.
+    Браузеры не закрываются после диапазона и переиспользуются следующими вызовами.
+    """
+    if not url_dict:
+        return
+
+    workers = workers or PARSER_WORKERS
+    workers = max(1, min(workers, len(url_dict)))
+
+    url_queue = queue.Queue()
+    for key, url in url_dict.items():
+        url_queue.put((key, url))
+
+    logger.info(f"Запуск пула браузеров: {workers}, страниц: {len(url_dict)}, "
+                f"частота запросов: {scrape_limiter.rates()}")
+    stream = PageStream()
+    managers = get_driver_pool(workers, create_options)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(offers_worker, worker_id, manager, url_queue, stream, logger, incomplete)
+                   for worker_id, manager in enumerate(managers)]
+        yield from stream.drain(lambda: all(future.done() for future in futures))
+
+    if not url_queue.empty():
+        logger.warning(f"Не загружено страниц: {url_queue.qsize()}")
+
+
+def iter_product_offers(url_dict, logger, mode=None, incomplete=None):
+    """
+    Отдаёт (ключ, HTML) страниц товаров по мере загрузки.
+    В режиме http_first сначала пробует обычный HTTP-запрос и отправляет в браузер
+    только страницы без маркеров товара или со страницей проверки на бота.
+    Ключи страниц, загруженных браузером не полностью (истекло ожидание), добавляются в incomplete.
+    """
+    mode = mode or FETCH_MODE
+    if mode != 'http_first':
+        yield from iter_product_offers_browser(url_dict, logger, incomplete=incomplete)
+        return
+
+    fallback = {}
+    yield from iter_pages_http(url_dict, get_random_user_agent(), fallback, logger)
+    yield from iter_product_offers_browser(fallback, logger, incomplete=incomplete)
+
+
+def normalize_prices(prices):
+    """Переводит текст цен ("1 299 ₽") в числа; "N/A" и пустые значения - NaN"""
+    return pd.to_numeric(pd.Series(prices, dtype=object).str.replace(r'[^\d.]', '', regex=True),
+                         errors='coerce').astype(float)
+
+
+def offers_frame(offers, logger):
+    """DataFrame предложений (market_with_mp, mp_on_market) из списка (продавец, текст цены)"""
     if not offers:
-        logger.warning("Элементы product-offer не найдены. Проверка альтернативных элементов.")
-        # Здесь можно добавить проверку на наличие альтернативных элементов
-        # Например, элемент, указывающий на отсутствие товара
-
-    data = []
-    for offer in offers:
-        seller_name = offer.find('span', class_='pdp-merchant-rating-block__merchant-name')
-        seller_name = seller_name.text if seller_name else "N/A"
-
-        current_price = offer.find('span', class_='product-offer-price__amount')
-        current_price = current_price.text.strip() if current_price else "N/A"
-
-        data.append({
-            'market_with_mp': seller_name,
-            'mp_on_market': current_price
-        })
-
-    if not data:
         logger.warning("Не удалось извлечь данные о предложениях.")
         return None
 
-    df = pd.DataFrame(data)
-
-    if 'mp_on_market' in df.columns:
-        df['mp_on_market'] = df['mp_on_market'].apply(
-            lambda x: float(re.sub(r'[^\d.]', '', x)) if x != "N/A" else np.nan)
+    df = pd.DataFrame(offers, columns=['market_with_mp', 'mp_on_market'])
+    df['mp_on_market'] = normalize_prices(df['mp_on_market'].to_numpy())
 
     return df
 
 
-def scrape_megamarket(input_df):
-    logger = loger
-    logger.info("Начало выполнения функции scrape_megamarket")
-
-    input_df = input_df.rename(columns={
-        'ART': 'seller_id',
-        'Product Name': 'name',
-        'URL': 'link'
-    })
+def extract_data(html_content, logger, backend=None, offers_only=None):
+    backend = backend or EXTRACTOR_BACKEND
+    offers_only = EXTRACTOR_OFFERS_ONLY if offers_only is None else offers_only
+    return offers_frame(extract_offers(html_content, backend, offers_only), logger)
 
-    product_info = dict(zip(input_df['name'], zip(input_df['link'], input_df['seller_id'])))
-    url_dict = {name: info[0] for name, info in product_info.items()}
 
-    html_contents = get_product_offers(url_dict, logger)
-
-    result_data = []
-
-    if html_contents:
-        for product_name, html_content in html_contents.items():
-            df = extract_data(html_content, logger)
-            if df is not None and not df.empty:
-                logger.info(f"Данные извлечены для {product_name}")
-                df['name'] = product_name
-                df['seller_id'] = product_info[product_name][1]
-                result_data.append(df)
-            else:
-                logger.warning(f"Не удалось извлечь данные для {product_name}.")
-                # Добавляем пустую строку для продуктов без данных
-                result_data.append(pd.DataFrame({
-                    'name': [product_name],
-                    'seller_id': [product_info[product_name][1]],
-                    'mp_on_market': [np.nan],
-                    'market_with_mp': ['N/A']
-                }))
-
-    if result_data:
-        result_df = pd.concat(result_data, ignore_index=True)
-
-        # Находим минимальную цену для каждого уникального seller_id
-        min_price_df = result_df.groupby('seller_id', as_index=False).apply(
-            lambda x: x.loc[x['mp_on_market'].idxmin() if not x['mp_on_market'].isna().all() else x.index[0]]
-        )
-
-        # Оставляем только нужные колонки в нужном порядке
-        final_df = min_price_df[['seller_id', 'name', 'mp_on_market', 'market_with_mp']]
-
-        logger.info("Скрипт успешно завершил работу")
-        return final_df
+def parse_page(html_content, digest, cache, logger):
+    """
+    Разбирает страницу в список (продавец, текст цены).
+    Для уже встречавшегося содержимого берёт предложения из кэша.
+    """
+    offers = cache.get_parsed(digest) if cache and digest else None
+    if offers is None:
+        offers = extract_offers(html_content, EXTRACTOR_BACKEND, EXTRACTOR_OFFERS_ONLY)
+        if cache and digest:
+            cache.put_parsed(digest, offers)
     else:
-        logger.error("Не удалось получить данные ни для одного продукта")
-        return pd.DataFrame()
-
+        logger.debug("Содержимое страницы не изменилось, предложения взяты из кэша")
+    return offers
 
-def extract_data(html_content, logger):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    offers = soup.find_all('div', class_='product-offer')
 
-    data = []
-    for offer in offers:
-        seller_name = offer.find('span', class_='pdp-merchant-rating-block__merchant-name')
-        seller_name = seller_name.text if seller_name else "N/A"
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
 
-        current_price = offer.find('span', class_='product-offer-price__amount')
-        current_price = current_price.text.strip() if current_price else "N/A"
 
-        data.append({
-            'market_with_mp': seller_name,
-            'mp_on_market': current_price
-        })
-
-    if not data:
-        logger.warning("Не удалось извлечь данные о предложениях.")
+def get_parse_pool():
+    """
+    Общий пул процессов для разбора страниц (None, если PARSE_PROCESSES = 0).
+    Процессы запускаются через spawn: родительский процесс многопоточный (браузеры, asyncio).
+    """
+    global _parse_pool
+    if PARSE_PROCESSES <= 0:
         return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES,
+                                              mp_context=multiprocessing.get_context('spawn'))
+        return _parse_pool
+
+
+def restart_parse_pool(broken):
+    """Заменяет сломанный пул (процесс разбора упал, например, из-за нехватки памяти) новым"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is broken:
+            _parse_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    return get_parse_pool()
+
+
+@atexit.register
+def shutdown_parse_pool():
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(cancel_futures=True)
+
+
+def iter_parsed_pages(pages, cache, logger):
+    """
+    Отдаёт (ключ товара, список (продавец, текст цены)) для потока страниц (ключ, (HTML, хэш)).
+    Страницы разбираются в пуле процессов, пока браузеры загружают следующие; в работе
+    одновременно не больше двух страниц на процесс. Порядок результатов не сохраняется.
+    Если процесс разбора упал, пул перезапускается и незавершённые страницы разбираются заново
+    (страница, на которой пул ломается повторно, пропускается).
+    """
+    pool = get_parse_pool()
+    if pool is None:
+        for key, (html_content, digest) in pages:
+            yield key, parse_page(html_content, digest, cache, logger)
+        return
+
+    pending = {}
+
+    def submit(key, html_content, digest, attempt=1):
+        nonlocal pool
+        try:
+            future = pool.submit(extract_offers, html_content, EXTRACTOR_BACKEND, False)
+        except BrokenProcessPool:
+            logger.warning("Пул процессов разбора сломан, перезапуск")
+            pool = restart_parse_pool(pool)
+            future = pool.submit(extract_offers, html_content, EXTRACTOR_BACKEND, False)
+        pending[future] = (key, digest, html_content, attempt)
+
+    def collect(futures):
+        for future in futures:
+            key, digest, html_content, attempt = pending.pop(future)
+            try:
+                offers = future.result()
+            except BrokenProcessPool:
+                if attempt < 2:
+                    submit(key, html_content, digest, attempt + 1)
+                else:
+                    logger.error(f"Разбор страницы {key} повторно сломал пул процессов, страница пропущена")
+                    yield key, []
+                continue
+            except Exception as e:
+                # Результат неудачного разбора не кэшируется: страница будет разобрана заново
+                logger.error(f"Ошибка разбора страницы {key}: {e}")
+                yield key, []
+                continue
+            if cache and digest:
+                cache.put_parsed(digest, offers)
+            yield key, offers
+
+    for key, (html_content, digest) in pages:
+        offers = cache.get_parsed(digest) if cache and digest else None
+        if offers is not None:
+            logger.debug("Содержимое страницы не изменилось, предложения взяты из кэша")
+            yield key, offers
+            continue
+
+        # Блок предложений вырезается здесь, чтобы в процесс передавались килобайты, а не вся страница
+        if EXTRACTOR_OFFERS_ONLY:
+            html_content = offers_block(html_content)
+        submit(key, html_content, digest)
+        if len(pending) >= 2 * PARSE_PROCESSES:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in pending if future.done()]
+        yield from collect(list(done))
+
+    # Страницы, отправленные заново после перезапуска пула, тоже дожидаются здесь
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        yield from collect(list(done))
+
+
+def iter_cached_product_offers(url_dict, cache, logger):
+    """
+    Отдаёт (ключ товара, (HTML, хэш содержимого)) по мере загрузки.
+    Свежие страницы берутся из кэша, остальные загружаются и сохраняются в кэш.
+    Страницы проверки на бота, без маркеров товара и загруженные не полностью не кэшируются
+    (хэш None, их предложения тоже не кэшируются): при следующем цикле они загружаются заново.
+    """
+    if cache is None:
+        for key, html in iter_product_offers(url_dict, logger):
+            yield key, (html, None)
+        return
+
+    to_fetch = {}
+    for key, url in url_dict.items():
+        cached = cache.get_fresh(url)
+        if cached:
+            yield key, cached
+        else:
+            to_fetch[key] = url
+    if len(to_fetch) < len(url_dict):
+        logger.info(f"Из кэша взято страниц: {len(url_dict) - len(to_fetch)} из {len(url_dict)}")
+
+    incomplete = set()
+    for key, html in iter_product_offers(to_fetch, logger, incomplete=incomplete):
+        if key in incomplete or classify_page(html) != 'ok':
+            yield key, (html, None)
+        else:
+            yield key, (html, cache.put(url_dict[key], html))
+
+
+def aggregate_min_offers(offers_df, exclude=()):
+    """
+    Выбирает предложение с минимальной ценой для каждого seller_id из плоской таблицы
+    предложений (seller_id, name, mp_on_market, market_with_mp), не учитывая магазины exclude.
+    Из равных цен берётся первое предложение, товар без цен получает первое предложение с NaN.
+    """
+    if offers_df.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    # Исключение своих магазинов: проверяем по множеству только уникальные названия
+    markets = pd.Categorical(offers_df['market_with_mp'])
+    excluded_codes = [code for code, market in enumerate(markets.categories) if market in exclude]
+    keep = ~np.isin(markets.codes, excluded_codes)
+    if not keep.any():
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    prices = offers_df['mp_on_market'].to_numpy(dtype=float)[keep]
+    seller_codes, sellers = pd.factorize(offers_df['seller_id'].to_numpy()[keep], sort=True)
+
+    # Сортировка по (seller_id, цена) устойчива, NaN оказываются в конце группы
+    order = np.lexsort((prices, seller_codes))
+    sorted_codes = seller_codes[order]
+    first_in_group = np.empty(len(order), dtype=bool)
+    first_in_group[:1] = True
+    first_in_group[1:] = sorted_codes[1:] != sorted_codes[:-1]
+
+    rows = np.flatnonzero(keep)[order[first_in_group]]
+    return offers_df.iloc[rows][RESULT_COLUMNS].reset_index(drop=True)
+
+
+class MinPriceAggregator:
+    """
+    Накапливает предложения страниц в плоскую колоночную таблицу и выбирает
+    минимальную цену конкурента для каждого seller_id одним векторным проходом.
+    Предложения собственных магазинов (exclude) не учитываются.
+    """
+
+    def __init__(self, exclude=()):
+        self.exclude = set(exclude)
+        self.seller_ids = []
+        self.names = []
+        self.markets = []
+        self.prices = []
+
+    def add(self, seller_id, name, offers):
+        """Добавляет список (продавец, текст цены) одной страницы"""
+        if not offers:
+            return
+        markets, prices = zip(*offers)
+        self.seller_ids.extend([seller_id] * len(offers))
+        self.names.extend([name] * len(offers))
+        self.markets.extend(markets)
+        self.prices.extend(prices)
+
+    def offers_table(self):
+        return pd.DataFrame({
+            'seller_id': self.seller_ids,
+            'name': self.names,
+            'mp_on_market': normalize_prices(self.prices).to_numpy(),
+            'market_with_mp': self.markets,
+        })
 
-    df = pd.DataFrame(data)
+    def result(self):
+        if not self.prices:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        return aggregate_min_offers(self.offers_table(), self.exclude)
 
-    if 'mp_on_market' in df.columns:
-        df['mp_on_market'] = df['mp_on_market'].apply(
-            lambda x: float(re.sub(r'[^\d.]', '', x)) if x != "N/A" else np.nan)
 
-    return df
+def iter_scraped_offers(url_dict, logger, run_id=None):
+    """
+    Отдаёт (ключ товара, список (продавец, текст цены)) по мере загрузки и разбора страниц.
+    Если указан run_id, ссылки, разобранные прерванным запуском с тем же run_id, берутся
+    из журнала загрузки; после полной загрузки журнал запуска очищается.
+    """
+    cache = get_page_cache() if PAGE_CACHE_ENABLED else None
+    journal = ScrapeJournal(run_id) if SCRAPE_JOURNAL_ENABLED and run_id is not None else None
 
+    if journal:
+        completed = journal.completed(url_dict.values())
+        to_fetch = {}
+        for key, url in url_dict.items():
+            if url in completed:
+                yield key, completed[url]
+            else:
+                to_fetch[key] = url
+        if completed:
+            logger.info(f"Продолжение по журналу: уже разобрано {len(url_dict) - len(to_fetch)} из {len(url_dict)}")
+        url_dict = to_fetch
 
-def scrape_megamarket(input_df):
+    try:
+        pages = iter_cached_product_offers(url_dict, cache, logger)
+        for key, offers in iter_parsed_pages(pages, cache, logger):
+            if journal:
+                journal.record(url_dict[key], offers)
+            yield key, offers
+    finally:
+        # Записи сохраняются и при ошибке или прерывании загрузки
+        if journal:
+            journal.flush()
+    if journal:
+        journal.finish()
+    if cache:
+        cache.evict()
+
+
+def scrape_megamarket(input_df, offers_source=None, cancelled=None):
+    """
+    Загружает предложения для товаров диапазона и возвращает минимальную цену конкурента по seller_id.
+    offers_source(url_dict, logger) отдаёт (ключ товара, предложения); по умолчанию - iter_scraped_offers.
+    cancelled (threading.Event) проверяется между товарами: после его установки загрузка
+    останавливается (браузеры пула заканчивают текущие страницы) и возвращается None.
+    """
     logger = loger
     logger.info("Начало выполнения функции scrape_megamarket")
+    offers_source = offers_source or iter_scraped_offers
 
     # Переименовываем колонки входного датафрейма
     input_df = input_df.rename(columns={
@@ -231,41 +543,51 @@ def scrape_megamarket(input_df):
         'URL': 'link'
     })
 
+    # Проверяем только товары, которые пора обновить, в порядке приоритета
+    sku_state = SkuStateStore()
+    input_df = prioritize(input_df, sku_state.load(input_df['seller_id']))
+    started = time.monotonic()
+    browser_seconds = fetch_stats.browser_seconds
+
     # Создаем словарь, где ключ - это название продукта, а значение - кортеж (URL, seller_id)
     product_info = dict(zip(input_df['name'], zip(input_df['link'], input_df['seller_id'])))
 
-    # Создаем словарь только с URL для функции get_product_offers
+    # Создаем словарь только с URL для загрузки страниц
     url_dict = {name: info[0] for name, info in product_info.items()}
 
-    html_contents = get_product_offers(url_dict, logger)
-
-    result_data = []
-
-    if html_contents:
-        for product_name, html_content in html_contents.items():
-            df = extract_data(html_content, logger)
-            if df is not None:
+    aggregator = MinPriceAggregator(exclude=my_markets)
+    fetched = set()
+    offers_iter = offers_source(url_dict, logger)
+    try:
+        for product_name, offers in offers_iter:
+            if cancelled is not None and cancelled.is_set():
+                logger.warning("Загрузка прервана: задание отменено")
+                return None
+            if offers:
                 logger.info(f"Данные извлечены для {product_name}")
-                df['name'] = product_name
-                df['seller_id'] = product_info[product_name][1]  # Добавляем seller_id
-                result_data.append(df)
+                aggregator.add(product_info[product_name][1], product_name, offers)
+                fetched.add(product_info[product_name][1])
             else:
                 logger.warning(f"Не удалось извлечь данные для {product_name}.")
-
-    if result_data:
-        result_df = pd.concat(result_data, ignore_index=True)
-        result_df = result_df[~result_df['market_with_mp'].isin(my_markets)]
-
-        # Находим минимальную цену для каждого уникального seller_id
-        min_price_df = result_df.groupby('seller_id').apply(
-            lambda x: x.loc[x['mp_on_market'].idxmin()]
-        ).reset_index(drop=True)
-
-        # Оставляем только нужные колонки в нужном порядке
-        final_df = min_price_df[['seller_id', 'name', 'mp_on_market', 'market_with_mp']]
-
+    finally:
+        # Закрытие источника останавливает загрузку страниц, в том числе при прерывании
+        offers_iter.close()
+
+    final_df = aggregator.result()
+
+    # Сохраняем наблюдения только для товаров, по которым получена цена; незагруженные
+    # и неудачные товары не отмечаются проверенными и остаются в очереди на загрузку.
+    # Полезные наблюдения - новые товары и изменившиеся цены
+    prices = dict(zip(final_df['seller_id'], final_df['mp_on_market']))
+    observations = [(seller_id, prices[seller_id]) for seller_id in fetched
+                    if seller_id in prices and not pd.isna(prices[seller_id])]
+    useful = sku_state.record(observations)
+    hours = max(fetch_stats.browser_seconds - browser_seconds, time.monotonic() - started) / 3600
+    logger.info(f"Полезных наблюдений: {useful} из {len(observations)} (товаров в диапазоне: {len(product_info)}), "
+                f"{useful / max(hours, 1e-9):.1f} в час работы браузера")
+
+    if not final_df.empty or not product_info:
         logger.info("Скрипт успешно завершил работу")
-        return final_df
     else:
         logger.error("Не удалось получить данные ни для одного продукта")
-        return pd.DataFrame()
\ No newline at end of file
+    return final_df
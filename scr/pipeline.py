@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from .config import PIPELINE_QUEUE_SIZE
+from .logger import logger
+
+_DONE = object()
+
+
+class StageStats:
+    """Счётчики стадии: обработано элементов, время работы, простоя в ожидании входа и блокировки на выходе"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+        self.max_depth = 0
+
+    def as_dict(self):
+        return {'items': self.items, 'busy_seconds': round(self.busy, 1), 'idle_seconds': round(self.idle, 1),
+                'blocked_seconds': round(self.blocked, 1), 'max_queue_depth': self.max_depth}
+
+
+class Pipeline:
+    """
+    Конвейер стадий с ограниченными очередями между ними.
+    Каждая стадия обрабатывает элементы по одному, но стадии работают одновременно:
+    пока одна стадия занята элементом N, следующая уже обрабатывает N-1, а предыдущая - N+1.
+    Обработчик стадии - корутина, возвращающая элемент для следующей стадии или None, чтобы его отбросить.
+    """
+
+    def __init__(self, queue_size=PIPELINE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.stats = []
+
+    async def run(self, items, *stages):
+        """Пропускает items через стадии (название, обработчик) и ждёт завершения всех стадий"""
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in stages]
+        self.stats = [StageStats(name) for name, _ in stages]
+
+        async def feed():
+            for item in items:
+                await queues[0].put(item)
+            await queues[0].put(_DONE)
+
+        async def work(index, handler):
+            stats = self.stats[index]
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            while True:
+                stats.max_depth = max(stats.max_depth, inbox.qsize())
+                started = time.monotonic()
+                item = await inbox.get()
+                stats.idle += time.monotonic() - started
+                if item is _DONE:
+                    if outbox:
+                        await outbox.put(_DONE)
+                    return
+
+                started = time.monotonic()
+                try:
+                    result = await handler(item)
+                except Exception as e:
+                    logger.error(f"Ошибка на стадии {stats.name}: {e}", exc_info=True)
+                    result = None
+                stats.busy += time.monotonic() - started
+                stats.items += 1
+
+                if result is not None and outbox:
+                    started = time.monotonic()
+                    await outbox.put(result)
+                    stats.blocked += time.monotonic() - started
+
+        await asyncio.gather(feed(), *[work(index, handler) for index, (_, handler) in enumerate(stages)])
+
+    def report(self, log=logger):
+        """Логирует глубину очередей и время простоя по стадиям"""
+        log.info("Статистика конвейера", stages={stats.name: stats.as_dict() for stats in self.stats})
@@ -0,0 +1,96 @@
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from .config import SQLITE_DB_NAME, PRICE_LEDGER_MAX_AGE_HOURS, PRICE_LEDGER_TOLERANCE
+from .logger import logger
+
+
+def rejected_offer_ids(response):
+    """offerId, которые сервер перечислил в ответе как неуспешные"""
+    rejected = set()
+    pending = [response]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, dict):
+            if 'offerId' in item and (item.get('error') or item.get('errors') or item.get('errorCode')
+                                      or item.get('success') in (False, 0)):
+                rejected.add(str(item['offerId']))
+            pending.extend(item.values())
+        elif isinstance(item, list):
+            pending.extend(item)
+    return rejected
+
+
+class PriceLedger:
+    """
+    Последняя успешно отправленная цена по (кабинет, offerId) и цена конкурента, на которой она основана.
+    Позволяет не отправлять цену повторно, пока ситуация у конкурента не изменилась.
+    """
+
+    def __init__(self, db_name=SQLITE_DB_NAME, max_age_hours=PRICE_LEDGER_MAX_AGE_HOURS,
+                 tolerance=PRICE_LEDGER_TOLERANCE):
+        self.db_name = db_name
+        self.max_age = max_age_hours * 3600
+        self.tolerance = tolerance
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS price_ledger (
+                    cabinet TEXT, offer_id TEXT, price REAL, competitor_price REAL, stop REAL, submitted_at REAL,
+                    PRIMARY KEY (cabinet, offer_id))
+            """)
+
+    def load(self, cabinet):
+        with sqlite3.connect(self.db_name) as conn:
+            ledger = pd.read_sql_query("SELECT offer_id, price, competitor_price, stop, submitted_at "
+                                       "FROM price_ledger WHERE cabinet = ?", conn, params=(cabinet,))
+        return ledger.set_index('offer_id')
+
+    def unchanged(self, df, cabinet, offer_id_col, competitor_col, stop_col, current_prices, now=None):
+        """
+        Маска строк, для которых цена конкурента и stop не изменились с последней отправки,
+        а текущая цена в таблице (до пересчёта, current_prices по индексу df) равна отправленной.
+        Если цену в таблице изменили вручную, строка отправляется заново.
+        """
+        now = now or time.time()
+        rows = self.load(cabinet).reindex(df[offer_id_col].astype(str))
+        competitor = pd.to_numeric(df[competitor_col], errors='coerce').to_numpy(dtype=float)
+        stop = pd.to_numeric(df[stop_col], errors='coerce').to_numpy(dtype=float)
+        price = pd.to_numeric(current_prices.reindex(df.index), errors='coerce').to_numpy(dtype=float)
+        with np.errstate(invalid='ignore'):
+            same = ((np.abs(rows['competitor_price'].to_numpy(dtype=float) - competitor) < self.tolerance)
+                    & (np.abs(rows['stop'].to_numpy(dtype=float) - stop) < self.tolerance)
+                    & (np.abs(rows['price'].to_numpy(dtype=float) - price) < self.tolerance)
+                    & (now - rows['submitted_at'].to_numpy(dtype=float) < self.max_age))
+        return same
+
+    def record(self, cabinet, submitted, now=None):
+        """Сохраняет принятые сервером цены: список (offerId, цена, цена конкурента, stop)"""
+        now = now or time.time()
+        with sqlite3.connect(self.db_name) as conn:
+            conn.executemany("INSERT OR REPLACE INTO price_ledger VALUES (?, ?, ?, ?, ?, ?)",
+                             [(cabinet, str(offer_id), float(price), float(competitor), float(stop), now)
+                              for offer_id, price, competitor, stop in submitted])
+
+    def reconcile(self, cabinet, df, results, offer_id_col, price_col, competitor_col, stop_col):
+        """Записывает цены из пачек, принятых сервером, кроме offerId, отклонённых в ответе"""
+        accepted = set()
+        for stats in results:
+            if stats['ok']:
+                accepted.update(set(stats['offer_ids']) - rejected_offer_ids(stats.get('response')))
+        rows = df[df[offer_id_col].astype(str).isin(accepted)]
+        self.record(cabinet, zip(rows[offer_id_col], rows[price_col], rows[competitor_col], rows[stop_col]))
+        logger.info(f"Журнал отправленных цен обновлён: {len(rows)} из {len(df)}", cabinet=cabinet)
+
+
+_ledger = None
+
+
+def get_price_ledger():
+    """Общий для процесса журнал отправленных цен"""
+    global _ledger
+    if _ledger is None:
+        _ledger = PriceLedger()
+    return _ledger
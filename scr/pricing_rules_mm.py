@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .config import PRICING_RULES_FILE
+from .logger import logger
+
+# Окно по умолчанию: на 50-200 рублей ниже mp_on_market, но не ниже stop
+DEFAULT_RULES = [{"type": "undercut_window", "min": 50, "max": 200}]
+
+
+def undercut_window(step):
+    """Случайная цена на min..max рублей ниже mp_on_market"""
+    low_offset, high_offset = float(step['min']), float(step['max'])
+    if low_offset > high_offset:
+        raise ValueError(f"undercut_window: min ({low_offset}) больше max ({high_offset})")
+    return lambda mp_on_market, stop: (mp_on_market - high_offset, mp_on_market - low_offset)
+
+
+def undercut_percent(step):
+    """Цена на percent процентов ниже mp_on_market"""
+    factor = 1 - float(step['percent']) / 100
+    return lambda mp_on_market, stop: (mp_on_market * factor, mp_on_market * factor)
+
+
+def match(step):
+    """Цена, равная mp_on_market"""
+    return lambda mp_on_market, stop: (mp_on_market, mp_on_market)
+
+
+def ceiling(step):
+    """Верхняя граница цены: value рублей и/или stop_ratio от stop"""
+    value = float(step.get('value', np.inf))
+    stop_ratio = float(step.get('stop_ratio', np.inf))
+    if np.isinf(value) and np.isinf(stop_ratio):
+        raise ValueError("ceiling: нужно указать value или stop_ratio")
+    return lambda stop: np.minimum(value, stop * stop_ratio)
+
+
+def round_ending(step):
+    """Округление вниз до цены, оканчивающейся на ending (9 - 1229, 99 - 1199, 990 - 10990)"""
+    ending = int(step['ending'])
+    modulus = 10 ** len(str(ending))
+    return lambda prices: np.floor((prices - ending) / modulus) * modulus + ending
+
+
+TARGETS = {'undercut_window': undercut_window, 'undercut_percent': undercut_percent, 'match': match}
+CEILINGS = {'ceiling': ceiling}
+ENDINGS = {'round_ending': round_ending}
+
+
+class RuleSet:
+    """
+    Набор правил расчёта цены кабинета, скомпилированный в операции над массивами.
+    Правила применяются к строкам, где price > mp_on_market > stop, в порядке:
+    ровно одно целевое правило (окно [нижняя, верхняя] от mp_on_market), ограничения сверху,
+    выбор целой цены из окна, округления окончаний. Цена никогда не опускается ниже stop;
+    если окно целиком ниже stop, цена не меняется.
+    После каждого расчёта в stats - сколько строк затронуло каждое правило и время расчёта.
+    """
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.target = None
+        self.ceilings = []
+        self.endings = []
+        for step in steps:
+            kind = step.get('type')
+            label = step.get('name', kind)
+            if kind in TARGETS:
+                if self.target is not None:
+                    raise ValueError(f"Правила {name}: больше одного целевого правила ({kind})")
+                self.target = (label, TARGETS[kind](step))
+            elif kind in CEILINGS:
+                self.ceilings.append((label, CEILINGS[kind](step)))
+            elif kind in ENDINGS:
+                self.endings.append((label, ENDINGS[kind](step)))
+            else:
+                raise ValueError(f"Правила {name}: неизвестный тип правила {kind}")
+        if self.target is None:
+            raise ValueError(f"Правила {name}: нет целевого правила ({', '.join(TARGETS)})")
+        self.stats = {}
+
+    def evaluate(self, price, mp_on_market, stop, rng):
+        """
+        Векторный расчёт новых цен.
+        Возвращает (маска обновления, маска изменённых цен, новые цены) для массивов price, mp_on_market, stop.
+        """
+        started = time.perf_counter()
+        self.stats = {'rows': len(price)}
+
+        def timed(label, func, *args):
+            step_started = time.perf_counter()
+            result = func(*args)
+            self.stats.setdefault(label, {'rows': 0, 'seconds': 0.0})['seconds'] += time.perf_counter() - step_started
+            return result
+
+        def touched(label, count):
+            self.stats[label]['rows'] += int(count)
+
+        with np.errstate(invalid='ignore'):
+            mask = (price > mp_on_market) & (mp_on_market > stop)
+        self.stats['eligible'] = int(mask.sum())
+        mp_on_market, stop = mp_on_market[mask], stop[mask]
+
+        label, target = self.target
+        low, high = timed(label, target, mp_on_market, stop)
+        touched(label, len(mp_on_market))
+        for label, cap in self.ceilings:
+            limit = timed(label, cap, stop)
+            touched(label, (high > limit).sum())
+            low, high = np.minimum(low, limit), np.minimum(high, limit)
+
+        low = np.maximum(low, stop)
+        possible = low <= high
+        self.stats['below_stop'] = int((~possible).sum())
+        floor = np.trunc(stop[possible])
+        prices = rng.integers(np.trunc(low[possible]).astype(np.int64), np.trunc(high[possible]).astype(np.int64),
+                              endpoint=True).astype(float)
+        for label, rounding in self.endings:
+            rounded = timed(label, rounding, prices)
+            touched(label, (rounded != prices).sum())
+            prices = rounded
+        self.stats['stop_floor'] = int((prices < floor).sum())
+        prices = np.maximum(prices, floor)
+
+        changed = np.zeros(len(price), dtype=bool)
+        changed[np.flatnonzero(mask)[possible]] = True
+        new_prices = price.copy()
+        new_prices[changed] = prices
+        self.stats['changed'] = int(changed.sum())
+        self.stats['seconds'] = time.perf_counter() - started
+        return mask, changed, new_prices
+
+    def report(self, log):
+        """Сводка последнего расчёта: строки, затронутые каждым правилом, и время"""
+        rules = {label: {'rows': value['rows'], 'ms': round(value['seconds'] * 1000, 2)}
+                 for label, value in self.stats.items() if isinstance(value, dict)}
+        log.info(f"Правила цен {self.name}: изменено {self.stats.get('changed', 0)} из {self.stats.get('rows', 0)} "
+                 f"за {self.stats.get('seconds', 0) * 1000:.1f} мс",
+                 eligible=self.stats.get('eligible'), below_stop=self.stats.get('below_stop'),
+                 stop_floor=self.stats.get('stop_floor'), rules=rules)
+
+
+def load_rules(path=PRICING_RULES_FILE):
+    """
+    Читает правила цен из JSON: набор по умолчанию в default, наборы кабинетов в cabinets.
+    Без файла все кабинеты используют окно 50-200 рублей ниже mp_on_market.
+    """
+    if not os.path.exists(path):
+        return {'default': DEFAULT_RULES, 'cabinets': {}}
+    with open(path, encoding='utf-8') as f:
+        rules = json.load(f)
+    return {'default': rules.get('default', DEFAULT_RULES), 'cabinets': rules.get('cabinets', {})}
+
+
+_rule_sets = {}
+
+
+def get_rule_set(cabinet=None, path=PRICING_RULES_FILE):
+    """Скомпилированный набор правил кабинета (компилируется один раз за процесс)"""
+    key = (path, cabinet)
+    if key not in _rule_sets:
+        rules = load_rules(path)
+        steps = rules['cabinets'].get(cabinet, rules['default']) if cabinet else rules['default']
+        _rule_sets[key] = RuleSet(cabinet or 'default', steps)
+    return _rule_sets[key]
+
+
+def dry_run(df, rule_set, seed=None):
+    """Расчёт цен без отправки: DataFrame строк с изменённой ценой и сводка в лог"""
+    numeric = {col: pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+               for col in ['price', 'mp_on_market', 'stop']}
+    mask, changed, new_prices = rule_set.evaluate(numeric['price'], numeric['mp_on_market'], numeric['stop'],
+                                                  np.random.default_rng(seed))
+    rule_set.report(logger)
+    result = df[changed].copy()
+    result['new_price'] = new_prices[changed]
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пробный расчёт цен по правилам без отправки в МегаМаркет")
+    parser.add_argument('csv', help="CSV с колонками price, mp_on_market, stop (например, отладочный из report/)")
+    parser.add_argument('--cabinet', help="кабинет из файла правил (по умолчанию - набор default)")
+    parser.add_argument('--rules', default=PRICING_RULES_FILE, help="файл правил")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    changes = dry_run(pd.read_csv(args.csv), get_rule_set(args.cabinet, args.rules), args.seed)
+    print(changes.to_string())
@@ -0,0 +1,116 @@
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from .config import (
+    SCRAPE_RATE_PER_MINUTE, SCRAPE_RATE_MIN_PER_MINUTE, SCRAPE_RATE_MAX_PER_MINUTE, SCRAPE_RATE_JITTER,
+    SCRAPE_BACKOFF_SECONDS, SCRAPE_BACKOFF_MAX_SECONDS, SCRAPE_SPEEDUP_AFTER
+)
+from .logger import logger
+
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+
+class HostState:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        self.successes = 0
+
+
+class AdaptiveRateLimiter:
+    """
+    Планировщик вежливости: отдельное ведро токенов на каждый хост.
+    После таймаута или страницы проверки частота падает в backoff_factor раз и включается
+    экспоненциальная пауза; после серии из speedup_after успехов частота растёт до max_rate.
+    """
+
+    def __init__(self, rate_per_minute=SCRAPE_RATE_PER_MINUTE, min_rate=SCRAPE_RATE_MIN_PER_MINUTE,
+                 max_rate=SCRAPE_RATE_MAX_PER_MINUTE, jitter=SCRAPE_RATE_JITTER, burst=1,
+                 backoff_seconds=SCRAPE_BACKOFF_SECONDS, max_backoff_seconds=SCRAPE_BACKOFF_MAX_SECONDS,
+                 backoff_factor=2.0, speedup_after=SCRAPE_SPEEDUP_AFTER, speedup_factor=1.2):
+        self.initial_rate = rate_per_minute
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate_per_minute)
+        self.jitter = jitter
+        self.burst = burst
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.backoff_factor = backoff_factor
+        self.speedup_after = speedup_after
+        self.speedup_factor = speedup_factor
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def state(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.initial_rate, self.burst)
+        return self.hosts[host]
+
+    def reserve(self, host):
+        """Резервирует запрос к хосту и возвращает, сколько секунд нужно подождать перед ним"""
+        with self.lock:
+            state = self.state(host)
+            now = time.monotonic()
+            per_second = state.rate / 60
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * per_second)
+            state.updated = now
+
+            # Отрицательные токены - уже зарезервированные запросы в очереди;
+            # во время паузы после ошибок очередь сдвигается на её окончание
+            wait = max(0.0, state.blocked_until - now) + max(0.0, (1 - state.tokens) / per_second)
+            state.tokens -= 1
+
+        if wait > 0:
+            wait *= 1 + random.uniform(-self.jitter, self.jitter)
+        return wait
+
+    def acquire(self, host):
+        time.sleep(self.reserve(host))
+
+    async def acquire_async(self, host):
+        await asyncio.sleep(self.reserve(host))
+
+    def success(self, host):
+        with self.lock:
+            state = self.state(host)
+            state.failures = 0
+            state.successes += 1
+            if state.successes >= self.speedup_after and state.rate < self.max_rate:
+                state.rate = min(self.max_rate, state.rate * self.speedup_factor)
+                state.successes = 0
+                logger.info(f"Частота запросов к {host} увеличена до {state.rate:.2f}/мин")
+
+    def failure(self, host, reason=""):
+        """Таймаут, ответ 403/429/5xx или страница проверки: снижает частоту и ставит экспоненциальную паузу"""
+        with self.lock:
+            state = self.state(host)
+            state.successes = 0
+            state.failures += 1
+            state.rate = max(self.min_rate, state.rate / self.backoff_factor)
+            pause = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (state.failures - 1))
+            state.blocked_until = max(state.blocked_until, time.monotonic() + pause)
+            state.tokens = min(state.tokens, 1)
+        logger.warning(f"Замедление запросов к {host} ({reason}): {state.rate:.2f}/мин, пауза {pause:.0f} с")
+
+    def max_backoff_remaining(self):
+        """Наибольшая оставшаяся пауза по всем хостам"""
+        with self.lock:
+            now = time.monotonic()
+            return max([state.blocked_until - now for state in self.hosts.values()] + [0.0])
+
+    def rates(self):
+        """Текущая частота запросов в минуту по хостам"""
+        with self.lock:
+            return {host: round(state.rate, 2) for host, state in self.hosts.items()}
+
+
+# Общий для процесса планировщик запросов к страницам товаров
+scrape_limiter = AdaptiveRateLimiter()
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+
+from .config import SCHEDULE_FILE, SQLITE_DB_NAME
+from .logger import logger
+
+
+class CabinetSchedule:
+    """Расписание одного кабинета: диапазон таблицы, ключ API и текущий интервал запуска"""
+
+    def __init__(self, name, sheet_range, api_key_env, interval_minutes, jitter_minutes, min_interval_minutes,
+                 max_interval_minutes, speedup_moved_share, slowdown_moved_share, catchup_spread_minutes):
+        self.name = name
+        self.sheet_range = sheet_range
+        self.api_key_env = api_key_env
+        self.interval = interval_minutes * 60
+        self.jitter = jitter_minutes * 60
+        self.min_interval = min_interval_minutes * 60
+        self.max_interval = max_interval_minutes * 60
+        self.speedup_moved_share = speedup_moved_share
+        self.slowdown_moved_share = slowdown_moved_share
+        self.catchup_spread = catchup_spread_minutes * 60
+        self.next_run = 0.0
+        self.running = False
+
+    @property
+    def range_tuple(self):
+        """(название, диапазон, ключ API) в формате update_data_mm"""
+        return self.name, self.sheet_range, os.getenv(self.api_key_env)
+
+    @property
+    def job_payload(self):
+        """Задание для воркера: ключ API передаётся именем переменной окружения, а не значением"""
+        return {'name': self.name, 'sheet_range': self.sheet_range, 'api_key_env': self.api_key_env}
+
+    def adapt(self, moved_share):
+        """Сокращает интервал, если цены конкурентов заметно двигались, и удлиняет, если почти нет"""
+        if moved_share is None:
+            return
+        if moved_share >= self.speedup_moved_share:
+            self.interval = max(self.min_interval, self.interval * 0.75)
+        elif moved_share <= self.slowdown_moved_share:
+            self.interval = min(self.max_interval, self.interval * 1.25)
+
+
+def load_schedule(path=SCHEDULE_FILE):
+    """Читает расписание кабинетов из JSON: общие значения в defaults, кабинеты в cabinets"""
+    with open(path, encoding='utf-8') as f:
+        schedule = json.load(f)
+    defaults = schedule.get('defaults', {})
+    return [CabinetSchedule(**{**defaults, **cabinet}) for cabinet in schedule['cabinets']]
+
+
+class Scheduler:
+    """
+    Запускает кабинеты каждый по своему интервалу с разбросом.
+    Кабинет не запускается повторно, пока не завершился предыдущий запуск.
+    Время последнего запуска и интервал хранятся в SQLite: после перерыва просроченные
+    кабинеты запускаются один раз, разнесённые на catchup_spread, а не все сразу.
+    """
+
+    def __init__(self, cabinets, db_name=SQLITE_DB_NAME, now=None):
+        self.cabinets = {cabinet.name: cabinet for cabinet in cabinets}
+        self.db_name = db_name
+        self.changed = asyncio.Event()
+        now = now or time.time()
+
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schedule_state (
+                    cabinet TEXT PRIMARY KEY, last_run REAL, interval_seconds REAL)
+            """)
+            state = {row[0]: row[1:] for row in conn.execute("SELECT * FROM schedule_state")}
+
+        overdue = 0
+        for cabinet in self.cabinets.values():
+            last_run, interval = state.get(cabinet.name, (None, None))
+            if interval:
+                cabinet.interval = min(cabinet.max_interval, max(cabinet.min_interval, interval))
+            cabinet.next_run = (last_run or 0) + cabinet.interval
+            if cabinet.next_run <= now:
+                cabinet.next_run = now + overdue * cabinet.catchup_spread
+                overdue += 1
+        if overdue:
+            logger.info(f"Просроченных кабинетов при запуске: {overdue}, запуск с разнесением")
+
+    def due(self, now=None):
+        """Кабинеты, которым пора запускаться и которые сейчас не выполняются"""
+        now = now or time.time()
+        return [cabinet for cabinet in self.cabinets.values() if not cabinet.running and cabinet.next_run <= now]
+
+    def seconds_until_next(self, now=None):
+        now = now or time.time()
+        waiting = [cabinet.next_run for cabinet in self.cabinets.values() if not cabinet.running]
+        return max(0.0, min(waiting) - now) if waiting else None
+
+    def start(self, cabinets):
+        for cabinet in cabinets:
+            cabinet.running = True
+
+    def finish(self, cabinet, moved_share=None, now=None):
+        """
+        Завершение запуска: интервал подстраивается под долю изменившихся цен конкурентов,
+        следующий запуск отсчитывается от завершения, поэтому пропущенные запуски не накапливаются.
+        """
+        now = now or time.time()
+        cabinet.adapt(moved_share)
+        cabinet.next_run = now + cabinet.interval + random.uniform(-cabinet.jitter, cabinet.jitter)
+        cabinet.running = False
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute("INSERT OR REPLACE INTO schedule_state VALUES (?, ?, ?)",
+                         (cabinet.name, now, cabinet.interval))
+        logger.info(f"Следующий запуск {cabinet.name} через {(cabinet.next_run - now) / 60:.1f} минут",
+                    interval_minutes=round(cabinet.interval / 60, 1), moved_share=moved_share)
+        self.changed.set()
+
+    async def wait(self):
+        """Ждёт наступления ближайшего запуска или завершения выполняющегося кабинета"""
+        self.changed.clear()
+        timeout = self.seconds_until_next()
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,90 @@
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from .config import MM_ARROW_STRINGS
+from .logger import logger
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Типы колонок диапазона: идентификаторы и тексты - строки, названия продавцов (повторяются) - категории,
+# цены - целые
+MM_SCHEMA = {
+    'seller_id': 'string',
+    'name': 'string',
+    'link': 'string',
+    'price': 'price',
+    'stop': 'price',
+    'mp_on_market': 'price',
+    'market_with_mp': 'category',
+    'prim': 'string',
+}
+
+
+@lru_cache(maxsize=None)
+def string_dtype():
+    """Строковый тип колонок: на Arrow, если включено MM_ARROW_STRINGS и установлен pyarrow"""
+    if MM_ARROW_STRINGS and pyarrow is not None:
+        return pd.StringDtype('pyarrow')
+    if MM_ARROW_STRINGS:
+        logger.warning("MM_ARROW_STRINGS включено, но pyarrow не установлен: используются обычные строки")
+    return pd.StringDtype('python')
+
+
+def price_column(values):
+    """
+    Цены целыми числами (int64), если все значения целые; иначе float64 с NaN.
+    Пустые цены не приводятся к nullable Int64: остальной код работает с ценами как с массивами float.
+    """
+    prices = pd.to_numeric(values, errors='coerce')
+    numbers = np.asarray(prices, dtype=float)
+    if len(numbers) and np.isfinite(numbers).all() and (numbers == np.trunc(numbers)).all():
+        return prices.astype(np.int64)
+    return prices.astype(float)
+
+
+def typed_column(values, kind):
+    """Колонка типа схемы из Series или списка значений; колонки без типа возвращаются как есть"""
+    if kind == 'price':
+        return price_column(values)
+    if kind == 'string':
+        return pd.Series(values, dtype=string_dtype())
+    if kind == 'category':
+        return pd.Series(values, dtype='category')
+    return values
+
+
+def apply_schema(df, schema=MM_SCHEMA):
+    """Приводит колонки диапазона к типам схемы; колонки заменяются, исходные данные не изменяются"""
+    columns = {col: typed_column(df[col], schema.get(col)) for col in df.columns}
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 / 1024 if df is not None else 0.0
+
+
+class FrameStats:
+    """Время стадий обработки диапазона и память его DataFrame (пик - максимум одновременно живых таблиц)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.seconds = {}
+        self.peak_mb = 0.0
+        self.started = time.monotonic()
+
+    def stage(self, name, *frames):
+        """Отмечает окончание стадии name и таблицы, которые живы после неё"""
+        now = time.monotonic()
+        self.seconds[name] = round(now - self.started, 3)
+        self.started = now
+        self.peak_mb = max(self.peak_mb, sum(frame_mb(frame) for frame in frames))
+
+    def report(self, log):
+        log.info(f"Обработка {self.rows} строк: пик памяти таблиц {self.peak_mb:.1f} МБ, "
+                 f"{sum(self.seconds.values()):.2f} с", stage_seconds=self.seconds)
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+from .auth import get_credentials
+from .config import SHEETS_HTTP_TIMEOUT
+
+_service = None
+_service_lock = threading.Lock()
+_local = threading.local()
+
+
+def build_service(creds):
+    """
+    Клиент Sheets API строится один раз на процесс.
+    Документ discovery берётся из пакета googleapiclient без загрузки и без файлового кэша.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = build('sheets', 'v4', credentials=creds, static_discovery=True, cache_discovery=False)
+        return _service
+
+
+def thread_http(creds):
+    """
+    HTTP-транспорт рабочего потока с постоянным соединением.
+    httplib2 не потокобезопасен, поэтому у каждого потока пула свой транспорт,
+    который переиспользуется всеми запросами этого потока.
+    """
+    http = getattr(_local, 'http', None)
+    if http is None or http.credentials is not creds:
+        http = _local.http = AuthorizedHttp(creds, http=httplib2.Http(timeout=SHEETS_HTTP_TIMEOUT))
+    return http
+
+
+async def sheets_service():
+    """Общий клиент Sheets API; при первом обращении строится вне цикла событий"""
+    if _service is not None:
+        return _service
+    creds = await get_credentials()
+    return await asyncio.to_thread(build_service, creds)
+
+
+async def execute(request):
+    """Выполняет запрос к Sheets API в рабочем потоке через его постоянное соединение"""
+    creds = await get_credentials()
+    return await asyncio.to_thread(lambda: request.execute(http=thread_http(creds)))
@@ -0,0 +1,112 @@
+import math
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from .config import (
+    SQLITE_DB_NAME, SCRAPE_BUDGET_FRACTION, SKU_MIN_REFRESH_HOURS, SKU_MAX_REFRESH_HOURS,
+    SKU_RECENT_CHANGE_DAYS, SKU_NEAR_STOP_PERCENT
+)
+from .logger import logger
+
+
+class SkuStateStore:
+    """
+    Состояние товаров между циклами: когда цена конкурента проверялась последний раз,
+    какой она была и как часто менялась. Хранится в SQLite рядом с остальными данными.
+    """
+
+    def __init__(self, db_name=SQLITE_DB_NAME):
+        self.db_name = db_name
+        with sqlite3.connect(self.db_name) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sku_state (
+                    seller_id TEXT PRIMARY KEY, last_seen REAL, last_price REAL,
+                    last_change REAL, changes INTEGER DEFAULT 0, observations INTEGER DEFAULT 0);
+                CREATE TABLE IF NOT EXISTS sku_price_history (seller_id TEXT, observed_at REAL, price REAL);
+                CREATE INDEX IF NOT EXISTS sku_price_history_id ON sku_price_history (seller_id, observed_at);
+            """)
+
+    def load(self, seller_ids):
+        """DataFrame состояния по seller_id (строки без истории отсутствуют)"""
+        with sqlite3.connect(self.db_name) as conn:
+            state = pd.read_sql_query("SELECT * FROM sku_state", conn)
+        state = state[state['seller_id'].isin({str(seller_id) for seller_id in seller_ids})]
+        return state.set_index('seller_id')
+
+    def record(self, observations, now=None):
+        """
+        Сохраняет наблюдения (seller_id, цена конкурента или NaN).
+        Возвращает количество полезных наблюдений: новые товары и изменившиеся цены.
+        """
+        now = now or time.time()
+        observations = [(str(seller_id), None if pd.isna(price) else float(price))
+                        for seller_id, price in observations]
+        if not observations:
+            return 0
+
+        previous = self.load([seller_id for seller_id, _ in observations])['last_price'].to_dict()
+        useful = 0
+        history = []
+        with sqlite3.connect(self.db_name) as conn:
+            for seller_id, price in observations:
+                known = seller_id in previous
+                old_price = previous.get(seller_id)
+                old_price = None if old_price is None or pd.isna(old_price) else old_price
+                changed = not known or old_price != price
+                useful += changed
+                if changed:
+                    history.append((seller_id, now, price))
+                conn.execute("""
+                    INSERT INTO sku_state (seller_id, last_seen, last_price, last_change, changes, observations)
+                    VALUES (?, ?, ?, NULL, 0, 1)
+                    ON CONFLICT (seller_id) DO UPDATE SET
+                        last_seen = excluded.last_seen,
+                        last_price = excluded.last_price,
+                        last_change = CASE WHEN ? THEN excluded.last_seen ELSE last_change END,
+                        changes = changes + ?,
+                        observations = observations + 1
+                """, (seller_id, now, price, int(changed and known), int(changed and known)))
+            conn.executemany("INSERT INTO sku_price_history VALUES (?, ?, ?)", history)
+        return useful
+
+
+def prioritize(df, state, now=None, budget_fraction=SCRAPE_BUDGET_FRACTION):
+    """
+    Отбирает строки для загрузки в порядке приоритета и ограничивает их бюджетом.
+    Первыми идут новые и давно не проверявшиеся товары, затем товары с недавним
+    изменением цены и товары, у которых цена конкурента близка к stop.
+    Стабильные товары проверяются реже: раз в SKU_MAX_REFRESH_HOURS вместо SKU_MIN_REFRESH_HOURS.
+    """
+    now = now or time.time()
+    seller_ids = df['seller_id'].astype(str)
+    rows = state.reindex(seller_ids)
+
+    age_hours = ((now - rows['last_seen'].to_numpy(dtype=float)) / 3600)
+    recently_changed = (now - rows['last_change'].to_numpy(dtype=float)) < SKU_RECENT_CHANGE_DAYS * 86400
+    volatility = rows['changes'].to_numpy(dtype=float) / np.maximum(rows['observations'].to_numpy(dtype=float), 1)
+
+    # Интервал обновления: от максимального у стабильных до минимального у часто меняющихся товаров
+    volatility = np.nan_to_num(volatility, nan=1.0)
+    refresh_hours = SKU_MAX_REFRESH_HOURS - (SKU_MAX_REFRESH_HOURS - SKU_MIN_REFRESH_HOURS) * np.minimum(volatility * 2, 1)
+    refresh_hours = np.where(recently_changed, SKU_MIN_REFRESH_HOURS, refresh_hours)
+
+    mp_on_market = pd.to_numeric(df['mp_on_market'], errors='coerce').to_numpy(dtype=float)
+    stop = pd.to_numeric(df['stop'], errors='coerce').to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        near_stop = (mp_on_market - stop) / stop * 100 <= SKU_NEAR_STOP_PERCENT
+
+    score = age_hours / refresh_hours + recently_changed * 0.5 + np.nan_to_num(near_stop) * 0.5
+    score = np.where(np.isnan(age_hours), np.inf, score)
+
+    # Пора проверить: новые, устаревшие по своему интервалу и близкие к stop товары
+    with np.errstate(invalid='ignore'):
+        due = np.isnan(age_hours) | (age_hours >= refresh_hours) | (near_stop & (age_hours >= SKU_MIN_REFRESH_HOURS))
+    budget = math.ceil(len(df) * budget_fraction)
+
+    order = np.argsort(-score, kind='stable')
+    selected = order[due[order]][:budget]
+    logger.info(f"Отобрано товаров для проверки: {len(selected)} из {len(df)} (пора проверить: {int(due.sum())})")
+    return df.iloc[selected]
@@ -0,0 +1,43 @@
+import queue
+import threading
+
+from .config import STREAM_BUFFER_PAGES
+
+
+class PageStream:
+    """
+    Ограниченная очередь загруженных страниц между потоками загрузки и разбором.
+    Загрузчики ждут, пока в очереди не освободится место, поэтому в памяти
+    одновременно находится не больше maxsize страниц.
+    """
+
+    def __init__(self, maxsize=STREAM_BUFFER_PAGES):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stopped = threading.Event()
+        self.sent = set()
+
+    def emit(self, key, html):
+        """Передаёт страницу на разбор; возвращает False, если чтение прекращено"""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put((key, html), timeout=0.5)
+                self.sent.add(key)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def stop(self):
+        self.stopped.set()
+
+    def drain(self, is_done):
+        """Отдаёт страницы по мере поступления, пока загрузка не завершится и очередь не опустеет"""
+        try:
+            while True:
+                try:
+                    yield self.queue.get(timeout=0.5)
+                except queue.Empty:
+                    if is_done() and self.queue.empty():
+                        return
+        finally:
+            self.stop()
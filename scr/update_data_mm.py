@@ -1,10 +1,11 @@
 import pandas as pd
 import numpy as np
 import logging
-import random
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from .logger import logger
+from .pricing_rules_mm import RuleSet, get_rule_set
+from .schema_mm import price_column, string_dtype
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,104 +23,105 @@ async def run_in_executor(func, *args):
 async def update_dataframe(df1: pd.DataFrame, df2: pd.DataFrame) -> pd.DataFrame:
     """
     Асинхронно обновляет первый DataFrame данными из второго DataFrame на основе seller_id.
-    Обрабатывает случаи, когда типы данных seller_id могут отличаться.
+    Строки второго DataFrame выравниваются по seller_id первого (сравнение по тексту,
+    типы seller_id могут отличаться); заменяются только mp_on_market и market_with_mp,
+    остальные колонки не копируются, а типы колонок первого DataFrame сохраняются.
     """
 
     def update_df():
-        df1_updated = df1.copy()
-        df2_updated = df2.copy()
+        scraped = df2.drop_duplicates('seller_id')
+        found = scraped[['mp_on_market', 'market_with_mp']].set_axis(scraped['seller_id'].astype(str)) \
+            .reindex(df1['seller_id'].astype(str))
+
+        columns = {col: df1[col] for col in df1.columns}
+        prices = found['mp_on_market'].to_numpy(dtype=float)
+        columns['mp_on_market'] = price_column(pd.Series(
+            np.where(np.isnan(prices), pd.to_numeric(df1['mp_on_market'], errors='coerce'), prices),
+            index=df1.index))
+
+        markets = found['market_with_mp'].to_numpy(dtype=object)
+        markets = pd.Series(np.where(pd.isna(markets), df1['market_with_mp'].to_numpy(dtype=object), markets),
+                            index=df1.index)
+        dtype = df1['market_with_mp'].dtype
+        columns['market_with_mp'] = markets.astype('category' if isinstance(dtype, pd.CategoricalDtype) else dtype)
+        return pd.DataFrame(columns, index=df1.index, copy=False)
 
-        df1_updated['seller_id'] = df1_updated['seller_id'].astype(str)
-        df2_updated['seller_id'] = df2_updated['seller_id'].astype(str)
-
-        merged_df = df1_updated.merge(df2_updated[['seller_id', 'mp_on_market', 'market_with_mp']],
-                                      on='seller_id',
-                                      how='left',
-                                      suffixes=('', '_new'))
-
-        merged_df['mp_on_market'] = merged_df['mp_on_market_new'].fillna(merged_df['mp_on_market'])
-        merged_df['market_with_mp'] = merged_df['market_with_mp_new'].fillna(merged_df['market_with_mp'])
-
-        merged_df = merged_df.drop(['mp_on_market_new', 'market_with_mp_new'], axis=1)
-
-        original_type = df1['seller_id'].dtype
-        merged_df['seller_id'] = merged_df['seller_id'].astype(original_type)
+    return await run_in_executor(update_df)
 
-        return merged_df
 
-    return await run_in_executor(update_df)
+def messages(template, *columns):
+    """
+    Сообщения prim по шаблону str.format для всех выбранных строк.
+    Форматирование по спискам значений быстрее и экономнее по памяти, чем склейка массивов строк numpy.
+    """
+    columns = [np.asarray(col).tolist() for col in columns]
+    return np.fromiter(map(template.format, *columns), dtype=object, count=len(columns[0]))
 
 
-async def compare_prices_and_create_for_update(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+async def compare_prices_and_create_for_update(df: pd.DataFrame, seed=None,
+                                               rules: RuleSet = None) -> tuple[pd.DataFrame, pd.DataFrame]:
     """
     Асинхронно сравнивает цену из колонки price с mp_on_market и создает новый DataFrame for_update.
-    Обновляет цену на целое число, которое на 50-200 рублей ниже mp_on_market, но не ниже stop.
+    Новая цена рассчитывается по набору правил кабинета; по умолчанию - целое число,
+    которое на 50-200 рублей ниже mp_on_market, но не ниже stop.
     Логирует случаи, когда невозможно установить новую цену в заданных пределах.
+    Расчёт выполняется операциями над массивами; при одинаковом seed результат воспроизводим.
 
     Параметры:
     df (pd.DataFrame): DataFrame с колонками seller_id, name, link, price, stop, mp_on_market, market_with_mp
+    seed: начальное значение генератора случайных цен (None - случайное)
+    rules (RuleSet): скомпилированные правила цен (None - правила по умолчанию)
 
     Возвращает:
     tuple: (pd.DataFrame, pd.DataFrame) - (Обновленный исходный DataFrame, Новый DataFrame for_update)
     """
     try:
-        updated_df = df.copy()
-        updated_df['prim'] = ''
+        # Колонки только заменяются целиком, поэтому данные исходного DataFrame не копируются
+        updated_df = df.copy(deep=False)
 
         # Преобразуем числовые колонки
         numeric_columns = ['price', 'mp_on_market', 'stop']
         for col in numeric_columns:
             updated_df[col] = pd.to_numeric(updated_df[col], errors='coerce')
 
-            # Проверяем на наличие NaN значений
+        # Проверяем на наличие NaN значений
         nan_mask = updated_df[numeric_columns].isna().any(axis=1)
         if nan_mask.any():
             logger.warning(f"Обнаружены NaN значения в {nan_mask.sum()} строках")
-            logger.warning(updated_df[nan_mask].to_string())
+            logger.warning(updated_df[nan_mask].head(50).to_string())
 
-            # Создаем маску для обновления
-        mask = (updated_df['price'] > updated_df['mp_on_market']) & (updated_df['mp_on_market'] > updated_df['stop'])
+        price = updated_df['price'].to_numpy(dtype=float)
+        mp_on_market = updated_df['mp_on_market'].to_numpy(dtype=float)
+        stop = updated_df['stop'].to_numpy(dtype=float)
 
-        async def calculate_new_price(row):
-            try:
-                old_price = row['price']
-                mp_on_market = row['mp_on_market']
-                stop = row['stop']
+        rules = rules or get_rule_set()
+        mask, changed, new_prices = rules.evaluate(price, mp_on_market, stop, np.random.default_rng(seed))
+        rules.report(logger)
+        unchanged = mask & ~changed
+        with np.errstate(invalid='ignore'):
+            below_stop = mp_on_market <= stop
 
-                min_new_price = max(mp_on_market - 200, stop)
-                max_new_price = mp_on_market - 50
+        prim = np.full(len(updated_df), '', dtype=object)
+        prim[changed] = messages("Цена изменена с {:.2f} на {:.2f} (mp_on_market: {:.2f})",
+                                 price[changed], new_prices[changed], mp_on_market[changed])
+        prim[unchanged] = messages("Цена не изменена. Текущая цена: {:.2f}, mp_on_market: {:.2f}, stop: {:.2f}",
+                                   price[unchanged], mp_on_market[unchanged], stop[unchanged])
 
-                if min_new_price > max_new_price:
-                    return old_price, f"Цена не изменена. Текущая цена: {old_price:.2f}, mp_on_market: {mp_on_market:.2f}, stop: {stop:.2f}"
-
-                new_price = max(random.randint(int(min_new_price), int(max_new_price)), int(stop))
-                return new_price, f"Цена изменена с {old_price:.2f} на {new_price:.2f} (mp_on_market: {mp_on_market:.2f})"
-            except Exception as e:
-                logger.error(f"Ошибка при расчете новой цены для товара {row['seller_id']}: {str(e)}")
-                return row['price'], f"Ошибка при расчете новой цены: {str(e)}"
-
-                # Асинхронно применяем функцию calculate_new_price
-
-        results = await asyncio.gather(
-            *[calculate_new_price(row) for _, row in updated_df[mask].iterrows()]
-        )
-
-        # Проверяем, есть ли результаты для обработки
-        if results:
-            new_prices, new_prims = zip(*results)
-            updated_df.loc[mask, 'price'] = new_prices
-            updated_df.loc[mask, 'prim'] = new_prims
-        else:
+        # Проверка на оптимальную цену
+        if below_stop.any():
+            prim[below_stop] = messages("Оптимальная цена mp_on_market ({:.2f}) ниже или равна минимальной stop "
+                                        "({:.2f}) для товара с артикулом {}", mp_on_market[below_stop],
+                                        stop[below_stop], updated_df['seller_id'].to_numpy()[below_stop])
+            examples = updated_df['seller_id'].to_numpy()[below_stop][:20].tolist()
+            logger.warning(f"Оптимальная цена mp_on_market ниже или равна минимальной stop для {int(below_stop.sum())} "
+                           f"товаров, артикулы: {examples}")
+
+        if not mask.any():
             logger.info("Нет строк для обновления цен")
 
-        for_update = updated_df[mask].copy()
-
-        # Проверка на оптимальную цену
-        for index, row in updated_df.iterrows():
-            if row['mp_on_market'] <= row['stop']:
-                warning_msg = f"Оптимальная цена mp_on_market ({row['mp_on_market']:.2f}) ниже или равна минимальной stop ({row['stop']:.2f}) для товара с артикулом {row['seller_id']}"
-                logger.warning(warning_msg)
-                updated_df.loc[index, 'prim'] = warning_msg
+        updated_df['price'] = price_column(pd.Series(new_prices, index=updated_df.index))
+        updated_df['prim'] = pd.Series(prim, index=updated_df.index, dtype=string_dtype())
+        for_update = updated_df[mask]
 
         return updated_df, for_update
 
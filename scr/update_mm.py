@@ -2,58 +2,170 @@ import asyncio
 import aiohttp
 import pandas as pd
 import json
+import time
+from .config import (
+    MM_API_BASE_URL, MM_PRICE_BATCH_SIZE, MM_PRICE_CONCURRENCY, MM_PRICE_RETRIES,
+    MM_PRICE_BACKOFF_SECONDS, MM_API_TIMEOUT
+)
 from .logger import logger
+from .price_ledger_mm import get_price_ledger
 
+PRICE_SAVE_PATH = "/api/merchantIntegration/v1/offerService/manualPrice/save"
 
-async def update_prices_mm(df, token, offer_id_col, price_col, is_deleted_col, debug=False):
-    async with aiohttp.ClientSession() as session:
-        url = "https://api.megamarket.tech/api/merchantIntegration/v1/offerService/manualPrice/save"
-
-        prices = []
-        for _, row in df.iterrows():
-            offer_id = row[offer_id_col]
-            isDeleted = False
-            prices.append({
-                "offerId": str(offer_id),
-                "price": int(row[price_col]),
-                "isDeleted": bool(isDeleted)
-            })
-
-        data = {
-            "meta": {},
-            "data": {
-                "token": token,
-                "prices": prices
-            }
-        }
-
-        if debug:
-            logger.warning("Отладочный режим для MM включен. Запрос не будет отправлен.")
-            logger.warning("Отправляемые данные:")
-            logger.info(json.dumps(data, indent=2))
-        else:
-            try:
-                async with session.post(url, headers={"Content-Type": "application/json"},
-                                        data=json.dumps(data)) as response:
-                    if response.status == 200:
-                        response_data = await response.json()
-                        logger.warning(f"Цены для товаров успешно обновлены!")
-                        logger.warning(f"Ответ сервера: {response_data}")
-                    else:
+# Статусы, после которых пачку имеет смысл отправить повторно
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MegaMarketPriceClient:
+    """
+    Долгоживущий клиент API цен МегаМаркета с пулом keep-alive соединений и кэшем DNS.
+    Большие обновления делятся на пачки по batch_size, пачки отправляются параллельно
+    (не больше concurrency одновременно), повторяется только неудачная пачка.
+    """
+
+    def __init__(self, base_url=MM_API_BASE_URL, batch_size=MM_PRICE_BATCH_SIZE,
+                 concurrency=MM_PRICE_CONCURRENCY, retries=MM_PRICE_RETRIES,
+                 backoff_seconds=MM_PRICE_BACKOFF_SECONDS, timeout=MM_API_TIMEOUT):
+        self.url = base_url.rstrip('/') + PRICE_SAVE_PATH
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.session = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                 headers={"Content-Type": "application/json"})
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def send_chunk(self, semaphore, token, index, prices):
+        """Отправляет пачку цен с повторами; возвращает статистику пачки с ответом сервера"""
+        data = json.dumps({"meta": {}, "data": {"token": token, "prices": prices}})
+        session = await self.get_session()
+        stats = {'chunk': index, 'prices': len(prices), 'attempts': 0, 'status': None, 'ok': False}
+        started = time.monotonic()
+
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                stats['attempts'] = attempt + 1
+                try:
+                    async with session.post(self.url, data=data) as response:
+                        stats['status'] = response.status
+                        if response.status == 200:
+                            # Цены приняты при статусе 200; ответ не в JSON сохраняется текстом
+                            response_text = await response.text()
+                            try:
+                                stats['response'] = json.loads(response_text)
+                            except json.JSONDecodeError:
+                                logger.warning("Ответ сервера на отправку цен не в формате JSON", chunk=index)
+                                stats['response'] = response_text
+                            stats['ok'] = True
+                            break
                         response_text = await response.text()
-                        logger.error(f"Ошибка при отправке в МегаМаркет цен. Статус: {response.status}")
+                        logger.error(f"Ошибка при отправке в МегаМаркет цен. Статус: {response.status}",
+                                     chunk=index, attempt=attempt + 1)
                         logger.error(f"Ответ сервера: {response_text}")
-                        logger.warning(f"Заголовки ответа: {response.headers}")
-            except aiohttp.ClientError as e:
-                logger.error(f"Ошибка при отправке запроса: {str(e)}")
-            except json.JSONDecodeError:
-                logger.error("Ошибка при декодировании JSON-ответа")
-            except Exception as e:
-                logger.error(f"Неожиданная ошибка: {str(e)}")
+                        if response.status not in RETRY_STATUSES:
+                            break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    stats['status'] = type(e).__name__
+                    logger.error(f"Ошибка при отправке запроса: {str(e)}", chunk=index, attempt=attempt + 1)
+
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff_seconds * 2 ** attempt)
+
+        stats['seconds'] = round(time.monotonic() - started, 3)
+        stats['offer_ids'] = [price['offerId'] for price in prices]
+        return stats
+
+    async def save_prices(self, prices, token):
+        """Отправляет список цен пачками; возвращает статистику по каждой пачке в порядке отправки"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunks = [prices[start:start + self.batch_size] for start in range(0, len(prices), self.batch_size)]
+        results = await asyncio.gather(*[self.send_chunk(semaphore, token, index, chunk)
+                                         for index, chunk in enumerate(chunks)])
+
+        failed = [stats for stats in results if not stats['ok']]
+        logger.info("Отправка цен в МегаМаркет завершена",
+                    prices=len(prices), chunks=len(chunks), failed_chunks=len(failed),
+                    chunk_seconds=[stats['seconds'] for stats in results],
+                    chunk_status=[stats['status'] for stats in results])
+        return results
+
+
+_client = None
+
+
+def get_price_client():
+    """Общий для процесса клиент API цен"""
+    global _client
+    if _client is None:
+        _client = MegaMarketPriceClient()
+    return _client
+
+
+async def close_price_client():
+    if _client is not None:
+        await _client.close()
+
+
+def build_prices(df, offer_id_col, price_col):
+    """Список цен для API без построчного обхода DataFrame"""
+    offer_ids = df[offer_id_col].astype(str).tolist()
+    prices = df[price_col].astype(float).astype(int).tolist()
+    return [{"offerId": offer_id, "price": price, "isDeleted": False}
+            for offer_id, price in zip(offer_ids, prices)]
+
+
+async def update_prices_mm(df, token, offer_id_col, price_col, is_deleted_col, debug=False, client=None,
+                           cabinet=None, competitor_col='mp_on_market', stop_col='stop', ledger=None,
+                           current_prices=None):
+    """
+    Отправляет цены в МегаМаркет.
+    Если указан cabinet, принятые сервером цены записываются в журнал. Если к тому же переданы
+    current_prices (цены в таблице до пересчёта, по индексу df), строки, у которых цена конкурента,
+    stop и текущая цена не изменились с последней успешной отправки, пропускаются.
+    """
+    if cabinet is not None:
+        ledger = ledger or get_price_ledger()
+    if cabinet is not None and current_prices is not None:
+        unchanged = ledger.unchanged(df, cabinet, offer_id_col, competitor_col, stop_col, current_prices)
+        if unchanged.any():
+            logger.info(f"Пропущено цен без изменений с последней отправки: {int(unchanged.sum())} из {len(df)}",
+                        cabinet=cabinet)
+            df = df[~unchanged]
+
+    prices = build_prices(df, offer_id_col, price_col)
+    if not prices:
+        return []
+
+    if debug:
+        logger.warning("Отладочный режим для MM включен. Запрос не будет отправлен.")
+        logger.warning("Отправляемые данные:")
+        logger.info(json.dumps({"meta": {}, "data": {"token": token, "prices": prices}}, indent=2))
+        return []
 
-            # Пример использования
+    client = client or get_price_client()
+    results = await client.save_prices(prices, token)
+    if all(stats['ok'] for stats in results):
+        logger.warning(f"Цены для товаров успешно обновлены!")
+    for stats in results:
+        if stats['ok']:
+            logger.warning(f"Ответ сервера: {stats['response']}")
+    if cabinet is not None:
+        ledger.reconcile(cabinet, df, results, offer_id_col, price_col, competitor_col, stop_col)
+    return results
 
 
+# Пример использования
 if __name__ == "__main__":
     df = pd.DataFrame({
         "offer_id": ["103616"],
@@ -65,4 +177,4 @@ if __name__ == "__main__":
 
     logger.info("Начало обновления цен в МегаМаркет")
     asyncio.run(update_prices_mm(df, token, "offer_id", "price", "is_deleted", debug=False))
-    logger.info("Завершение обновления цен в МегаМаркет")
\ No newline at end of file
+    logger.info("Завершение обновления цен в МегаМаркет")